@@ -79,7 +79,8 @@ setup(
     entry_points={
         'console_scripts': [
             'git-doccommit = doccommit.cli:doccommit',
-            'git-docupdate = doccommit.cli:docupdate'
+            'git-docupdate = doccommit.cli:docupdate',
+            'git-docquery = doccommit.cli:docquery'
         ]
     },
 )
@@ -0,0 +1,92 @@
+"""
+Non-interactive creation of many commits. Commit specifications are read from a JSON
+lines file, validated against one shared XML ID index and committed one after another.
+Every specification is an object with the keys files, subject, message, references,
+xml_ids and merge_commits. Lists may be used instead of comma separated strings. Files are
+relative to the root of the repository.
+"""
+import argparse
+import json
+import os
+import pygit2
+from doccommit import git
+from doccommit import xml
+
+
+def read_specs(filename):
+    """
+    Iterate over (line number, specification, problem) of a JSON lines file. If a line
+    is not a JSON object, the specification is None and problem describes the error.
+    """
+    with open(filename, 'r') as spec_file:
+        for number, line in enumerate(spec_file, 1):
+            if not line.strip():
+                continue
+            try:
+                spec = json.loads(line)
+            except ValueError as error:
+                yield number, None, "Invalid JSON: " + str(error)
+                continue
+            if isinstance(spec, dict):
+                yield number, spec, None
+            else:
+                yield number, None, "A commit specification must be a JSON object."
+
+
+def spec_to_args(spec):
+    """
+    Turn a commit specification into the arguments CommitMessage expects
+    """
+    def csv(value):
+        if isinstance(value, (list, tuple)):
+            return ",".join(value)
+        return value
+
+    files = spec.get("files", [])
+    return argparse.Namespace(files=[files] if isinstance(files, str) else files,
+                              subject=spec.get("subject"),
+                              message=spec.get("message"),
+                              reference=csv(spec.get("references")),
+                              xml_ids=csv(spec.get("xml_ids")),
+                              merge_commits=csv(spec.get("merge_commits")))
+
+
+def run(docrepo, filename, jobs=None, report=print):
+    """
+    Validate all commit specifications of a file and commit the valid ones. The index is
+    reset to HEAD before every commit. A JSON object is reported for every specification.
+    Returns True if all commits have been created.
+    """
+    xml_index = xml.XmlIdIndex(os.path.join(docrepo.repo.workdir, "xml") + "/",
+                               os.path.join(docrepo.repo.path, "doccommit"), jobs)
+    xml_index.build().join()
+    messages = []
+    for number, spec, problem in read_specs(filename):
+        if problem is None:
+            try:
+                args = spec_to_args(spec)
+                commit_message = git.CommitMessage(docrepo, args, xml_index=xml_index)
+                valid = commit_message.format()
+            except (AttributeError, TypeError, ValueError) as error:
+                problem = "Invalid commit specification: " + str(error)
+        if problem is None:
+            messages.append((number, args.files, commit_message, valid,
+                             commit_message.problems))
+        else:
+            messages.append((number, [], None, False, [problem]))
+
+    no_problem = True
+    for number, files, commit_message, valid, problems in messages:
+        result = {"line": number, "ok": valid, "problems": problems}
+        if valid:
+            try:
+                docrepo.reset_repo()
+                docrepo.stage_add_files(files)
+                result["commit"] = str(docrepo.commit(commit_message.final_message))
+            except (OSError, KeyError, ValueError, pygit2.GitError) as error:
+                result["ok"] = False
+                result["problems"] = [str(error)]
+        no_problem = no_problem and result["ok"]
+        report(json.dumps(result))
+    docrepo.reset_repo()
+    return no_problem
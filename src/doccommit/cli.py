@@ -17,8 +17,7 @@ Why does this file exist, and why not put this in __main__?
 import argparse
 import sys
 import os
-from doccommit import git
-from doccommit import gui
+from doccommit import trace
 
 
 def parse_cli_commit(args=None):
@@ -47,6 +46,30 @@ def parse_cli_commit(args=None):
                         help='Automatic line wrap for message text')
     parser.add_argument('-e', '--editor', action='store_true',
                         help='Final check is performed in the default editor')
+    parser.add_argument('-j', '--jobs', metavar='N', dest='jobs', type=int,
+                        help='Number of processes used to parse the XML source')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep the XML ID index in memory and answer requests of ' + \
+                             'other git doccommit calls')
+    parser.add_argument('--batch', metavar='FILE.jsonl', dest='batch', type=str,
+                        help='Create the commits described in a JSON lines file without ' + \
+                             'user interaction')
+    parser.add_argument('--diff-lines', metavar='N', dest='diff_lines', type=int, default=2000,
+                        help='Maximum number of lines shown in the diff preview')
+    parser.add_argument('-p', '--pathspec', metavar='PATH', dest='pathspecs', action='append',
+                        help='Only list changed files below this path in interactive mode, ' + \
+                             'can be used more than once, e.g. -p xml/ -p images/src/')
+    parser.add_argument('--hook', metavar='HOOK', dest='hook', type=str,
+                        choices=['commit-msg', 'pre-receive'],
+                        help='Run as git hook, e.g. --hook commit-msg MESSAGE_FILE in ' + \
+                             '.git/hooks/commit-msg')
+    parser.add_argument('--range', metavar='OLD..NEW', dest='range', type=str,
+                        help='Validate all commits of a range, e.g. in CI')
+    parser.add_argument('--trace', metavar='FILE', dest='trace', type=str,
+                        help='Write the duration of every phase to FILE in the Chrome ' + \
+                             'trace format, same as DOCCOMMIT_TRACE=FILE')
+    parser.add_argument('--profile', metavar='PHASE', dest='profile', type=str,
+                        help='Profile a traced phase with cProfile, e.g. validate')
     parser.set_defaults(command='commit')
 
     return parser.parse_args(args=args)
@@ -62,6 +85,29 @@ def parse_cli_docupdate(args=None):
 
     parser.add_argument('--file', type=str,
                         help='Path to the XML file containing the doc update section')
+    parser.add_argument('revision', metavar='revision', type=str, nargs='?', default='HEAD',
+                        help='Create the doc update section for the history of this revision')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Ignore the stored checkpoint and parse the whole history again')
+    parser.add_argument('--trace', metavar='FILE', dest='trace', type=str,
+                        help='Write the duration of every phase to FILE in the Chrome ' + \
+                             'trace format, same as DOCCOMMIT_TRACE=FILE')
+    parser.add_argument('--profile', metavar='PHASE', dest='profile', type=str,
+                        help='Profile a traced phase with cProfile, e.g. docupdate')
+    return parser.parse_args(args=args)
+
+
+def parse_cli_docquery(args=None):
+    """
+    Parse command line arguments with argparse
+    """
+    parser = argparse.ArgumentParser(description="""This git subcommand lists the commits
+    created by git doccommit that mention a reference or an XML ID.""")
+
+    parser.add_argument('values', metavar='value', type=str, nargs='+',
+                        help='Reference like bsc#12345 or XML ID')
+    parser.add_argument('-r', '--revision', type=str, default='HEAD',
+                        help='Search the history of this revision')
     return parser.parse_args(args=args)
 
 
@@ -69,20 +115,58 @@ def doccommit(args=None):
     """
     Entry point for the doccomment command
     """
-    args = parse_cli_commit(args)
-    if not len(sys.argv) > 1:
+    if not (sys.argv[1:] if args is None else args):
         print("Nothing to do. Use --help")
-        quit()
-
-    path = git.find_root(os.getcwd())
-    docrepo = git.DocRepo(path)
-    commit_message = git.CommitMessage(docrepo, args)
-    my_gui = gui.commitGUI(commit_message, args)
-    if args.interactive:
-        my_gui.select_files()
-    else:
-        my_gui.final_check()
-    commit_message.commit()
+        return
+    args = parse_cli_commit(args)
+    trace.enable_from_args(args)
+
+    # pygit2 and dialog are only loaded when they are needed, not for --help
+    with trace.span("imports"):
+        from doccommit import git
+    with trace.span("find_root"):
+        path = git.find_root(os.getcwd())
+    with trace.span("DocRepo"):
+        docrepo = git.DocRepo(path, args.pathspecs)
+    if args.hook:
+        from doccommit import hook
+        with trace.span("hook", hook=args.hook):
+            no_problem = hook.run(docrepo, args.hook, args.files, args.jobs)
+        sys.exit(0 if no_problem else 1)
+    if args.range:
+        from doccommit import hook
+        with trace.span("range"):
+            no_problem = hook.check_range(docrepo, args.range, args.jobs)
+        sys.exit(0 if no_problem else 1)
+    if args.daemon:
+        from doccommit import daemon
+        daemon.serve(docrepo, args.jobs)
+        return
+    if args.batch:
+        from doccommit import batch
+        with trace.span("batch"):
+            no_problem = batch.run(docrepo, args.batch, args.jobs)
+        sys.exit(0 if no_problem else 1)
+    from doccommit import gui
+    with trace.span("CommitMessage"):
+        commit_message = git.CommitMessage(docrepo, args)
+        if args.reference != 'MINOR':
+            commit_message.xml_index.start()
+    with trace.span("gui"):
+        my_gui = gui.commitGUI(commit_message, args)
+        if args.interactive:
+            my_gui.select_files()
+        else:
+            my_gui.final_check()
+    with trace.span("commit"):
+        commit_message.commit()
+
+
+def main(args=None):
+    """
+    Entry point for python -m doccommit
+    """
+    doccommit(args)
 
 
 def docupdate(args=None):
@@ -90,6 +174,41 @@ def docupdate(args=None):
     Entry point for the docupdate command
     """
     args = parse_cli_docupdate(args)
-    if not len(sys.argv) > 1:
-        print("Nothing to do. Use --help")
-        quit()
+    trace.enable_from_args(args)
+
+    with trace.span("imports"):
+        from doccommit import git
+        from doccommit import history
+    with trace.span("find_root"):
+        path = git.find_root(os.getcwd())
+    with trace.span("DocRepo"):
+        docrepo = git.DocRepo(path)
+    checkpoint = history.Checkpoint(os.path.join(docrepo.repo.path, "doccommit"))
+    if args.rebuild:
+        checkpoint.oid = None
+    with trace.span("docupdate"):
+        lines = list(history.docupdate(docrepo, args.revision, checkpoint))
+    if args.file:
+        with open(args.file, 'w') as section_file:
+            for line in lines:
+                section_file.write(line + "\n")
+    else:
+        for line in lines:
+            print(line)
+
+
+def docquery(args=None):
+    """
+    Entry point for the docquery command
+    """
+    args = parse_cli_docquery(args)
+    from doccommit import git
+    from doccommit import history
+    path = git.find_root(os.getcwd())
+    docrepo = git.DocRepo(path)
+    index = history.TrailerIndex(os.path.join(docrepo.repo.path, "doccommit"))
+    index.update(docrepo.repo, args.revision)
+    for value in args.values:
+        for oid in index.query(git.normalize_reference(value)):
+            print(oid + " " + docrepo.repo[oid].message.split("\n", 1)[0])
+    index.close()
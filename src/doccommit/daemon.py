@@ -0,0 +1,186 @@
+"""
+Resident index daemon. It keeps the XML ID index and the repository in memory and
+answers requests over a UNIX domain socket, so commits do not have to wait for the XML
+source to be parsed. Requests and answers are single lines of JSON. Besides lookups of
+XML IDs, whole commit messages can be validated.
+"""
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+from doccommit import xml
+
+
+def socket_path(docrepo):
+    """
+    Path of the daemon socket of a repository
+    """
+    return os.path.join(docrepo.repo.path, "doccommit", "daemon.sock")
+
+
+def request(path, message, timeout=1.0):
+    """
+    Send a request to the daemon listening on path. Returns the answer or None if no
+    daemon is running.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(path)
+            client.sendall(json.dumps(message).encode() + b"\n")
+            chunks = []
+            while True:
+                chunk = client.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b"\n"):
+                    break
+        return json.loads(b"".join(chunks).decode())
+    except (OSError, ValueError):
+        return None
+
+
+def is_running(path):
+    """
+    Check if a daemon answers on path
+    """
+    answer = request(path, {"command": "ping"})
+    return answer is not None and answer.get("ok", False)
+
+
+def lookup_xml_ids(path, xml_ids):
+    """
+    Ask the daemon for the titles of XML IDs. Returns a dict with all known IDs,
+    or None if no daemon is running.
+    """
+    answer = request(path, {"command": "lookup", "ids": list(xml_ids)})
+    if answer is None or not answer.get("ok", False):
+        return None
+    return answer["ids"]
+
+
+def validate_message(path, text):
+    """
+    Ask the daemon to validate a commit message. Returns the list of problems, or None
+    if no daemon is running.
+    """
+    answer = request(path, {"command": "validate", "text": text}, timeout=5.0)
+    if answer is None or not answer.get("ok", False):
+        return None
+    return answer["problems"]
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answers a single request of a client
+    """
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline().decode())
+            answer = self.server.answer(message)
+        except (ValueError, KeyError, TypeError):
+            answer = {"ok": False, "error": "Invalid request."}
+        self.wfile.write(json.dumps(answer).encode() + b"\n")
+
+
+class IndexServer(socketserver.UnixStreamServer):
+    """
+    Socket server that keeps the XML ID index of a repository up to date. The xml
+    folder is polled for changes between requests.
+    """
+    def __init__(self, docrepo, workers=None):
+        self.docrepo = docrepo
+        self.workers = workers
+        self.xml_path = os.path.join(docrepo.repo.workdir, "xml")
+        self.cache = xml.IdCache(os.path.join(docrepo.repo.path, "doccommit"))
+        self.xml_source_ids = {}
+        self.graph = None
+        self.snapshot = None
+        self.refresh()
+        path = socket_path(docrepo)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+
+
+    def take_snapshot(self):
+        """
+        Listing of the xml folder and stamps of all files of the graph. Files that could
+        not be parsed or that do not exist yet are included, so fixing or creating them
+        is noticed, too.
+        """
+        try:
+            listing = sorted(os.listdir(self.xml_path))
+        except FileNotFoundError:
+            listing = None
+        files = self.graph.includes if self.graph is not None else ()
+        return (listing, {filename: xml.file_stamp(filename) for filename in files})
+
+
+    def refresh(self):
+        """
+        Update the index if a file in the xml folder changed. Only changed files are
+        parsed again.
+        """
+        snapshot = self.take_snapshot()
+        if snapshot == self.snapshot:
+            return
+        graph = xml.build_graph(self.xml_path, self.cache, self.workers)
+        xml_source_ids = {}
+        if graph is not None:
+            for xml_id, title, _ in graph.xml_ids():
+                xml_source_ids[xml_id] = title
+        self.xml_source_ids = xml_source_ids
+        self.graph = graph
+        self.snapshot = self.take_snapshot()
+
+
+    def service_actions(self):
+        self.refresh()
+
+
+    def answer(self, message):
+        """
+        Create the answer for a request
+        """
+        command = message["command"]
+        if command == "ping":
+            return {"ok": True}
+        if command == "lookup":
+            return {"ok": True, "ids": {xml_id: self.xml_source_ids[xml_id]
+                                        for xml_id in message["ids"]
+                                        if xml_id in self.xml_source_ids}}
+        if command == "validate":
+            # git imports this module
+            from doccommit import git
+            record = git.DocCommit.from_parsed(None, git.parse_message(message["text"]))
+            return {"ok": True, "problems": git.validate_commit(
+                record, self.xml_source_ids, self.docrepo.resolve_commits)}
+        return {"ok": False, "error": "Unknown command " + str(command) + "."}
+
+
+def serve(docrepo, workers=None, poll_interval=1.0):
+    """
+    Run the daemon until it is interrupted
+    """
+    path = socket_path(docrepo)
+    if is_running(path):
+        print("The daemon is already running.")
+        return
+    server = IndexServer(docrepo, workers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Listening on " + path)
+    try:
+        server.serve_forever(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
@@ -4,21 +4,96 @@ This is taylored towards SUSE-style repositories, usually made for daps.
 They contain DC files, as well as a "xml" folder with single DocBook-XML files.
 """
 
+import collections
+import copy
 import os
-import threading
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pygit2
+from doccommit import daemon
+from doccommit import trace
 from doccommit import xml
 from doccommit.gui import id_info, reference_info, subject_info, message_info, commit_info
 
+REFERENCE_PATTERN = re.compile(r"""
+    (?:bsc|boo|bnc)\#(?P<bsc>[0-9]+)
+  | https?://bugzilla\.(?:opensuse\.org|suse\.com|novell\.com)/show_bug\.cgi\?id=(?P<bsc_url>[0-9]+)\S*
+  | fate\#(?P<fate>[0-9]+)
+  | https?://fate\.suse\.com/(?P<fate_url>[0-9]+)\S*
+  | (?:doccomments?|dc)\#(?P<dc>[0-9]+)
+  | https?://doccomments\.provo\.novell\.com/33098/(?P<dc_url>[0-9]+)/\S*
+""", re.IGNORECASE | re.VERBOSE)
+
+TRAILERS = (("References:", "references"),
+            ("XML IDs:", "xml_ids"),
+            ("DocUpdate Merge:", "merge_commits"),
+            ("Update Merge:", "merge_commits"))
+
+SIGNATURE = "~~ created by git-doccommit"
+
+ParsedMessage = collections.namedtuple("ParsedMessage", ["subject", "message", "references",
+                                                         "xml_ids", "merge_commits",
+                                                         "doccommit"])
+
+VALID_REFERENCES = ['bsc', 'FATE', 'dc']
+
+CHECKS = ("subject", "message", "references", "xml_ids", "merge_commits")
+
+CheckResult = collections.namedtuple("CheckResult", ["name", "problems", "seconds"])
+
+CommitResolution = collections.namedtuple("CommitResolution", ["resolved", "ambiguous", "missing"])
+
+REFERENCE_TYPES = {"bsc": "bsc", "bsc_url": "bsc", "fate": "FATE", "fate_url": "FATE",
+                   "dc": "dc", "dc_url": "dc"}
+
+
+class DocCommit(collections.namedtuple("DocCommit", ["oid", "subject", "message", "references",
+                                                     "xml_ids", "merge_commits"])):
+    """
+    Immutable record of a doc commit. References, XML IDs and merge commits are tuples.
+    Unlike CommitMessage, it holds no repository or thread, so it is cheap enough to
+    keep one for every commit of the history. Use validate_commit and format_commit
+    to check and format it.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_message(cls, oid, text):
+        """
+        Parse a commit message into a DocCommit. Returns None if the message has not been
+        created by git doccommit.
+        """
+        parsed = parse_message(text)
+        if not parsed.doccommit or not parsed.subject:
+            return None
+        return cls.from_parsed(oid, parsed)
+
+
+    @classmethod
+    def from_parsed(cls, oid, parsed):
+        """
+        Create a DocCommit from a ParsedMessage
+        """
+        return cls(oid, parsed.subject, parsed.message,
+                   tuple(normalize_many(split_list(parsed.references))),
+                   split_list(parsed.xml_ids), split_list(parsed.merge_commits))
+
+
 class CommitMessage():
     """
     This class stores, formats and parses commit messages.
     """
-    def __init__(self, docrepo, args=None, commit_text=None):
+    def __init__(self, docrepo, args=None, commit_text=None, xml_index=None):
         self.final_message = ""
         self.docrepo = docrepo
         self.problems = []
+        self.timings = {}
+        # XML IDs are only checked for existence if this is True
+        self.lookup_xml_ids = True
+        jobs = None
         if args is not None:
+            jobs = getattr(args, "jobs", None)
             self.reference = args.reference if args.reference is not None else ""
             self.subject = args.subject if args.subject is not None else ""
             self.xml_ids = args.xml_ids if args.xml_ids is not None else ""
@@ -27,225 +102,160 @@ class CommitMessage():
         elif commit_text is not None:
             self.parse_commit_message(commit_text)
 
-
-        # Make sure to call self.require_xml_source_ids() before using the
-        # xml_source_ids dict.
-        self.xml_source_ids = {}
-        self.get_xml_ids = threading.Thread(target=xml.get_source_xml_ids,
-                                            args=(self.xml_source_ids, ))
-        self.get_xml_ids.start()
+        # The XML ID index is shared by all messages of the process and nothing is
+        # parsed before the first XML ID is validated.
+        if xml_index is None:
+            xml_index = xml.shared_index(str(os.getcwd())+"/xml/",
+                                         os.path.join(docrepo.repo.path, "doccommit"), jobs,
+                                         daemon.socket_path(docrepo))
+        self.xml_index = xml_index
 
 
     def parse_commit_message(self, text):
         """
         Parse subject, commit message, XML IDs, merge commits and references
-        from git commit text or editor.
-        """
-        subject_parsed = False
-        message_parsed = False
-        xml_ids_parsed = False
-        references_parsed = False
-        merge_commits_parsed = False
-        doccommit = False
-        fallback = 0
-        self.input_message = ""
-        for line in text.splitlines():
-            fallback = fallback + 1
-            if line.startswith('#') or line == "" or line.startswith('~~'):
-                continue
-            if not subject_parsed:
-                self.subject = line.strip()
-                subject_parsed = True
-            elif not line.startswith("References: ") and not message_parsed:
-                self.input_message = self.input_message + line.strip() + "\n"
-            elif line.startswith("References: ") and not references_parsed:
-                message_parsed = True
-                self.reference = line.replace("References:", "").strip()
-                references_parsed = True
-            elif line.startswith("XML IDs: ") and not xml_ids_parsed:
-                self.xml_ids = line.replace("XML IDs:", "").strip()
-                xml_ids_parsed = True
-            elif line.startswith("Update Merge: ") and not merge_commits_parsed:
-                self.merge_commits = line.replace("Update Merge:", "").strip()
-                merge_commits_parsed = True
-            elif line.startswith("~~ created by git-doccommit version"):
-                doccommit = True
-            if all([subject_parsed, message_parsed, xml_ids_parsed, references_parsed,
-                    merge_commits_parsed, doccommit]):
-                quit()
-                return True
-            elif fallback > 100:
-                quit()
-                return False
+        from git commit text or editor. Returns the ParsedMessage.
+        """
+        parsed = parse_message(text)
+        self.subject = parsed.subject
+        self.input_message = parsed.message
+        self.reference = parsed.references
+        self.xml_ids = parsed.xml_ids
+        self.merge_commits = parsed.merge_commits
+        return parsed
 
     def validate_references(self):
         """
         Validate the references string
         """
         self.normalize_reference()
-        no_problem = True
-        if '#' not in self.reference and self.reference != 'MINOR':
-            self.problems.append("Reference does not contain a number (#) sign.")
-            return False
-        if self.reference == 'MINOR':
-            return True
-        for single_reference in string_to_list(self.reference):
-            if not self.validate_reference(single_reference):
-                no_problem = False
-        return no_problem
+        problems = check_references(split_list(self.reference))
+        self.problems.extend(problems)
+        return not problems
 
 
     def normalize_reference(self):
-        import re
-        references = self.reference.split(",")
-        regexes = []
-        result = []
-        # normalize bsc
-        regexes.append((re.compile(r'(?i)(bsc#|boo#|bnc#)(?P<id>[0-9]+)'), r'bsc#\g<id>'))
-        regexes.append((re.compile(r'((http[s]?):\/\/)(bugzilla.)(opensuse.org|(suse|novell).com)"+\
-            "/show_bug\.cgi\?id=(?P<id>[0-9]+).*'), r'bsc#\g<id>'))
-        #normalize FATE
-        regexes.append((re.compile(r'(?i)(fate#)(?P<id>[0-9]+)'), r'FATE#\g<id>'))
-        regexes.append((re.compile(r'((http[s]?):\/\/)(fate.suse.com\/)(?P<id>[0-9]+).*'),
-                        r'FATE#\g<id>'))
-        #normalize doccomment
-        regexes.append((re.compile(r'(?i)(doccomments?#|dc#)(?P<id>[0-9]+)'), r'dc#\g<id>'))
-        regexes.append((re.compile(r'((http[s]?):\/\/)(doccomments.provo.novell.com\/33098\/)' + \
-                                   r'(?P<id>[0-9]+)/.*'), r'dc#\g<id>'))
-        for reference in references:
-            for regex, substitute in regexes:
-                reference, n = regex.subn(substitute, reference)
-                if n > 0:
-                    result.append(reference)
-
-        self.reference = ",".join(result)
+        """
+        Normalize all references, e.g. Bugzilla URLs to bsc#ID
+        """
+        self.reference = ",".join(normalize_many(self.reference.split(",")))
 
 
     def validate_reference(self, single_reference):
         """
         Validate if a reference is formatted as SOURCE#ID
         """
-        valid_references = ['bsc', 'FATE', 'dc']
-        # gh ?
-        # trello ? often private
-        # open tracker bug for all sources that are not covered
-        no_problem = True
-        [ref_type, ref_id] = single_reference.split('#')
-        if ref_type not in valid_references:
-            self.problems.append(single_reference+": Unknown reference type.")
-            no_problem = False
-        try:
-            ref_id = int(ref_id)
-        except ValueError:
-            self.problems.append(single_reference+": Reference ID is not a number.")
-            no_problem = False
-        return no_problem
+        problems = check_reference(single_reference)
+        self.problems.extend(problems)
+        return not problems
 
 
     def validate_merge_commits(self):
         """
         Validate merge commit hashes
         """
-        no_problem = True
-        if self.merge_commits == "" or self.merge_commits is None:
+        if self.merge_commits is None:
             return True
-        for commit in string_to_list(self.merge_commits):
-            if not self.docrepo.commit_exists(commit):
-                self.problems.append(commit + " is not a valid commit ID.")
-                no_problem = False
-        return no_problem
+        problems = check_merge_commits(split_list(self.merge_commits),
+                                       self.docrepo.resolve_commits)
+        self.problems.extend(problems)
+        return not problems
 
 
     def validate_xml_ids(self, remove_keyword=False):
         """
         Test if entered XML IDs exist in XML source
         """
-        if not self.xml_ids:
-            self.problems.append("No XML IDs entered.")
-            return False
-        if remove_keyword:
-            return True
-        no_problem = True
-        self.require_xml_source_ids()
-        for xml_id in string_to_list(self.xml_ids):
-            if xml_id not in self.xml_source_ids:
-                no_problem = False
-                self.problems.append(xml_id + " does not exist.")
-        return no_problem
+        xml_ids = split_list(self.xml_ids)
+        known_ids = None
+        if xml_ids and not remove_keyword:
+            known_ids = self.xml_index.find(xml_ids)
+        problems = check_xml_ids(xml_ids, known_ids)
+        self.problems.extend(problems)
+        return not problems
 
 
     def validate_subject(self):
         """
         Validate subject
         """
-        no_problem = True
-        if len(self.subject) > 50:
-            self.problems.append("Subject longer than 50 characters.")
-            no_problem = False
-        keywords = ['Add', 'Remove', 'Change']
-        if not any(keyword in self.subject for keyword in keywords):
-            self.problems.append("No keyword found in subject.")
-            no_problem = False
-        return no_problem
+        problems = check_subject(self.subject)
+        self.problems.extend(problems)
+        return not problems
 
 
     def validate_message(self):
         """
         Validate main text
         """
-        no_problem = True
-        if len(self.input_message) < len(self.subject):
-            self.problems.append("Subject is longer than description text.")
-            no_problem = False
-        for line in self.input_message.splitlines():
-            if len(line) > 72:
-                self.problems.append("Message line longer than 72 characters.")
-                no_problem = False
-        return no_problem
+        problems = check_message(self.input_message, self.subject)
+        self.problems.extend(problems)
+        return not problems
 
-    def validate(self):
+    def validate(self, report=None):
         """
-        Validates if the user input is good enough for a commit.
+        Validates if the user input is good enough for a commit. All checks run at the
+        same time, report is called with the CheckResult of every check as soon as it
+        has finished. The duration of each check is stored in self.timings.
         """
+        results = {}
+        with trace.span("validate"):
+            for result in self.iter_validation():
+                results[result.name] = result
+                if report is not None:
+                    report(result)
         self.problems = []
-        self.validate_subject()
-        self.validate_message()
-        self.validate_references()
-        self.validate_xml_ids()
-        self.validate_merge_commits()
+        for name in CHECKS:
+            self.problems.extend(results[name].problems)
+        self.timings = {name: results[name].seconds for name in CHECKS}
         return bool(not self.problems)
 
 
-    def format(self, comments=False):
+    def iter_validation(self):
+        """
+        Run all checks concurrently and yield their CheckResults in the order they finish.
+        The text checks usually finish while XML IDs and commits are still looked up.
+        """
+        self.normalize_reference()
+        record = self.record()
+
+        def xml_ids():
+            known_ids = None
+            if record.xml_ids and self.lookup_xml_ids:
+                known_ids = self.xml_index.find(record.xml_ids)
+            return check_xml_ids(record.xml_ids, known_ids)
+
+        checks = {"subject": lambda: check_subject(record.subject),
+                  "message": lambda: check_message(record.message, record.subject),
+                  "references": lambda: check_references(record.references),
+                  "xml_ids": xml_ids,
+                  "merge_commits": lambda: check_merge_commits(record.merge_commits,
+                                                               self.docrepo.resolve_commits)}
+        with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+            parent = trace.current()
+            futures = [executor.submit(timed_check, name, checks[name], parent)
+                       for name in CHECKS]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+    def format(self, comments=False, report=None):
         """
         Create a formatted commit message.
         """
-        result = ""
-        no_problem = True
-        if not self.validate():
-            no_problem = False
-        if comments:
-            result = result + subject_info + "\n"
-        result = result + self.subject + "\n\n"
-        if comments:
-            result = result + message_info + "\n"
-        result = result + self.input_message + "\n\n"
-        if comments:
-            result = result + reference_info + "\n"
-        result = result + "References: " + self.reference + "\n"
-        if comments:
-            result = result + "\n" + id_info + "\n"
-        result = result + "XML IDs: " + self.xml_ids + "\n"
-        if comments:
-            result = result + "\n" + commit_info + "\n"
-        if comments or (self.merge_commits is not None and self.merge_commits != ""):
-            result = result + "DocUpdate Merge: " + self.merge_commits
-
-        result = result + "\n~~ created by git-doccommit version 1.0.5"
-        self.final_message = result
+        no_problem = self.validate(report)
+        self.final_message = format_commit(self.record(), comments)
         return no_problem
 
 
+    def record(self, oid=None):
+        """
+        Returns the current input as DocCommit
+        """
+        return DocCommit(oid, self.subject, self.input_message, split_list(self.reference),
+                         split_list(self.xml_ids), split_list(self.merge_commits or ""))
+
+
     def commit(self, update=False):
         """
         Commit a message or write update to git notes if update=COMMITHASH is set.
@@ -261,31 +271,189 @@ class CommitMessage():
 
     def require_xml_source_ids(self):
         """
-        This function makes sure that the thread that is supposed to deliver the XML IDs
-        has finished it's work.
+        Returns the dict with all XML IDs of the source. It waits until the index is
+        complete, which is usually not needed for validation.
+        """
+        return self.xml_index.ids()
+
+
+class BlobIdCache(xml.IdCache):
+    """
+    IdCache for the DocBook files of a git tree. Entries are keyed by blob OID, so a blob
+    is parsed only once, no matter in how many commits or branches it appears. Includes
+    are stored relative to the including file.
+    """
+    version = 1
+    filename = "blob-ids.json"
+    max_entries = 50000
+
+    def __init__(self, tree, cache_dir=None):
+        self.tree = tree
+        # the cache that is saved, copies for other trees store their entries in it
+        self.origin = self
+        xml.IdCache.__init__(self, cache_dir)
+
+
+    def with_tree(self, tree):
+        """
+        Returns a cache for another tree that shares the entries with this one, e.g. to
+        read several commits at the same time. Only this cache should be saved, it also
+        contains the entries stored in the copies.
+        """
+        cache = copy.copy(self)
+        cache.tree = tree
+        return cache
+
+
+    def blob(self, filename):
+        """
+        Returns the blob of a file in the tree or None
+        """
+        try:
+            entry = self.tree[filename]
+        except KeyError:
+            return None
+        return entry if isinstance(entry, pygit2.Blob) else None
+
+
+    def read(self, filename):
+        """
+        Returns the content of a file in the tree or None
         """
-        self.get_xml_ids.join()
+        blob = self.blob(filename)
+        return blob.data if blob is not None else None
+
+
+    def lookup(self, filename):
+        blob = self.blob(filename)
+        entry = self.files.get(str(blob.id)) if blob is not None else None
+        if entry is None:
+            return None
+        directory = os.path.dirname(filename)
+        return entry["ids"], [os.path.normpath(os.path.join(directory, include))
+                              for include in entry["includes"]]
+
+
+    def store(self, filename, ids, includes):
+        directory = os.path.dirname(filename)
+        self.files[str(self.blob(filename).id)] = {
+            "ids": ids,
+            "includes": [os.path.relpath(include, directory or ".") for include in includes]}
+        self.origin.changed = True
+
+
+    def prune(self, filenames):
+        """
+        Blobs of other trees are kept, only the oldest entries are removed if the cache
+        grows too large.
+        """
+        for oid in list(self.files)[:max(0, len(self.files) - self.max_entries)]:
+            del self.files[oid]
+            self.changed = True
 
 
 class DocRepo():
     """
     Helper class that wraps around the pygit2 repository class
     """
-    def __init__(self, path):
+    def __init__(self, path, pathspecs=None):
         self.repo = pygit2.Repository(path)
         self.last_commit = ""
+        # (short) hashes of commits that have already been found and their full IDs
+        self.known_commits = {}
+        # only files below these paths are listed, e.g. ("xml/", "images/src/")
+        self.pathspecs = tuple(pathspec.strip("/") for pathspec in pathspecs or ()
+                               if pathspec.strip("/"))
+        self.status_cache = None
 
 
     def diff(self, cached=True):
-        return str(self.repo.diff('HEAD', cached=cached).patch)
+        with trace.span("diff"):
+            return str(self.repo.diff('HEAD', cached=cached).patch)
+
+
+    def diff_preview(self, cached=True, max_lines=2000, max_bytes=200000):
+        """
+        Iterate over the lines of a diff preview. A list of the changed files comes first,
+        followed by the hunks with the number of added and deleted lines of each file. The
+        patch of a file is only created when it is shown and the output stops when
+        max_lines or max_bytes is reached. Binary files are not shown.
+        """
+        with trace.span("diff.files"):
+            diff = self.repo.diff('HEAD', cached=cached)
+            # the binary flag of a delta is only known after loading the blobs, so the
+            # list only uses the status and the path
+            deltas = list(diff.deltas)
+        for delta in deltas:
+            yield " {0} {1}".format(delta.status_char(), delta.new_file.path)
+        yield " {0} file(s) changed".format(len(deltas))
+
+        lines = 0
+        size = 0
+        for number, delta in enumerate(deltas):
+            patch = diff[number]
+            if patch.delta.is_binary:
+                output = ["", delta.new_file.path + " | binary"]
+            else:
+                _, additions, deletions = patch.line_stats
+                output = ["", "{0} | +{1} -{2}".format(delta.new_file.path, additions,
+                                                       deletions),
+                          "--- a/" + delta.old_file.path, "+++ b/" + delta.new_file.path]
+                for hunk in patch.hunks:
+                    output.append(hunk.header.rstrip("\n"))
+                    output.extend(line.origin + line.content.rstrip("\n")
+                                  for line in hunk.lines)
+            for line in output:
+                lines += 1
+                size += len(line) + 1
+                if lines > max_lines or size > max_bytes:
+                    yield ""
+                    yield "[Diff truncated, {0} file(s) not shown completely]".format(
+                        len(deltas) - number)
+                    return
+                yield line
+
+
+    def in_pathspecs(self, filename):
+        """
+        Check if a file is below one of the pathspecs
+        """
+        if not self.pathspecs:
+            return True
+        return any(filename == pathspec or filename.startswith(pathspec + "/")
+                   for pathspec in self.pathspecs)
+
+
+    def scan_status(self):
+        """
+        Scan the working tree. Returns a dict filename -> status flags like
+        pygit2.Repository.status, limited to the files below the pathspecs.
+        """
+        status = self.repo.status()
+        if not self.pathspecs:
+            return status
+        return {filename: code for filename, code in status.items()
+                if self.in_pathspecs(filename)}
+
+
+    def status(self, refresh=False):
+        """
+        Returns the status of all changed files as dict filename -> status flags. The
+        working tree is only scanned once, the result is kept until the index is changed
+        or refresh is True.
+        """
+        if self.status_cache is None or refresh:
+            with trace.span("status", pathspecs=list(self.pathspecs)):
+                self.repo.index.read()
+                self.status_cache = self.scan_status()
+        return self.status_cache
 
 
     def stage(self):
         """
         Returns staged files as tuple (string filename, boolean staged)
         """
-        self.repo.index.read()
-        for filename, code in self.repo.status().items():
+        for filename, code in self.status().items():
             if code == 2:
                 yield (filename, True)
             elif code == 128 or code == 256:
@@ -296,19 +464,59 @@ class DocRepo():
         """
         iterator with staged files
         """
-        for filename, code in self.repo.status().items():
+        for filename, code in self.status().items():
             if code == 2:
                 yield (filename, True)
-            else:
-                pass
+
+
+    def staged_changes(self, path):
+        """
+        Check if the staged files below path differ from HEAD. In hooks, the index in
+        GIT_INDEX_FILE is used, e.g. for git commit -a.
+        """
+        index_file = os.environ.get("GIT_INDEX_FILE")
+        index = pygit2.Index(index_file) if index_file else self.repo.index
+        prefix = path.strip("/") + "/"
+        staged = {entry.path: entry.id for entry in index if entry.path.startswith(prefix)}
+        committed = {}
+        try:
+            trees = [(prefix, self.repo.head.peel(pygit2.Tree)[path.strip("/")])]
+        except (KeyError, pygit2.GitError):
+            trees = []
+        while trees:
+            directory, tree = trees.pop()
+            for entry in tree:
+                if isinstance(entry, pygit2.Tree):
+                    trees.append((directory + entry.name + "/", entry))
+                else:
+                    committed[directory + entry.name] = entry.id
+        return staged != committed
 
 
     def stage_add_file(self, filename):
         """
         add a file to the commit
         """
-        self.repo.index.add(filename)
-        self.repo.index.write()
+        self.stage_add_files([filename])
+
+
+    def stage_add_files(self, paths):
+        """
+        Add many files to the commit. Directories are added as pathspecs with all files
+        below them that are not ignored. The index is only written once.
+        """
+        with trace.span("stage"):
+            index = self.repo.index
+            directories = []
+            for path in paths:
+                if os.path.isdir(os.path.join(self.repo.workdir, path)):
+                    directories.append(path)
+                else:
+                    index.add(path)
+            if directories:
+                index.add_all(directories)
+            index.write()
+        self.status_cache = None
 
 
     def stage_add_all(self):
@@ -317,6 +525,7 @@ class DocRepo():
         """
         self.repo.index.add_all()
         self.repo.index.write()
+        self.status_cache = None
 
 
     def commit(self, message):
@@ -327,30 +536,109 @@ class DocRepo():
                                       self.repo.default_signature,
                                       self.repo.default_signature, message,
                                       self.repo.index.write_tree(),
-                                      [self.repo.head.get_object().hex])
+                                      [self.repo.head.target])
         self.last_commit = oid
+        self.status_cache = None
         return oid
 
 
+    def tree(self, rev=None):
+        """
+        Returns the tree of a commit, or the tree of the index if rev is None
+        """
+        if rev is None:
+            return self.repo[self.repo.index.write_tree()]
+        return self.repo.revparse_single(rev).peel(pygit2.Tree)
+
+
+    def xml_graph(self, rev=None, cache=None):
+        """
+        Build the XInclude graph of the DocBook source in a commit, or in the index if rev
+        is None. Files are read from the object database, not from the working directory.
+        A shared BlobIdCache can be passed, it is not saved. Returns None if there is no
+        xml folder.
+        """
+        tree = self.tree(rev)
+        if cache is None:
+            shared = False
+            cache = BlobIdCache(tree, os.path.join(self.repo.path, "doccommit"))
+        else:
+            shared = True
+            cache = cache.with_tree(tree)
+        try:
+            xml_tree = tree["xml"]
+        except KeyError:
+            return None
+        main_files = sorted("xml/" + entry.name for entry in xml_tree
+                            if entry.name.startswith("MAIN") and entry.name.endswith(".xml"))
+        graph = xml.IncludeGraph(cache, cache.read)
+        graph.add_books(main_files)
+        if not shared:
+            cache.prune(graph.includes)
+            cache.save()
+        return graph
+
+
+    def xml_ids(self, rev=None, cache=None):
+        """
+        Returns a dict with the XML IDs and titles of a commit or the index
+        """
+        xml_source_ids = {}
+        graph = self.xml_graph(rev, cache)
+        if graph is not None:
+            for xml_id, title, _ in graph.xml_ids():
+                xml_source_ids[xml_id] = title
+        return xml_source_ids
+
+
     def commit_exists(self, commit_hash):
         """
         check if commit exists
         """
-        try:
-            if self.repo.get(commit_hash.strip()):
-                return True
+        return commit_hash.strip() in self.resolve_commits([commit_hash]).resolved
+
+
+    def resolve_commits(self, commit_hashes):
+        """
+        Resolve many full or abbreviated commit hashes at once. Every hash is only looked
+        up once, commits that have been found before are taken from a cache. Returns a
+        CommitResolution with a dict of the full commit IDs and lists of the ambiguous
+        and of the missing hashes.
+        """
+        resolved = {}
+        ambiguous = []
+        missing = []
+        seen = set()
+        for commit_hash in commit_hashes:
+            commit_hash = commit_hash.strip()
+            if commit_hash in seen:
+                continue
+            seen.add(commit_hash)
+            if commit_hash in self.known_commits:
+                resolved[commit_hash] = self.known_commits[commit_hash]
+                continue
+            try:
+                commit = self.repo.get(commit_hash)
+            except ValueError as error:
+                if "ambiguous" in str(error).lower():
+                    ambiguous.append(commit_hash)
+                else:
+                    missing.append(commit_hash)
+                continue
+            if isinstance(commit, pygit2.Commit):
+                self.known_commits[commit_hash] = resolved[commit_hash] = str(commit.id)
             else:
-                return False
-        except ValueError:
-            return False
+                missing.append(commit_hash)
+        return CommitResolution(resolved, ambiguous, missing)
 
 
     def reset_repo(self):
         """
         reset files added to commit
         """
-        self.repo.reset(self.repo.head.get_object().hex, pygit2.GIT_RESET_MIXED)
+        self.repo.reset(self.repo.head.target, pygit2.GIT_RESET_MIXED)
         self.repo.index.read()
+        self.status_cache = None
 
 
 def find_root(path=os.getcwd()):
@@ -366,14 +654,194 @@ def find_root(path=os.getcwd()):
 
 
 
-def string_to_list(csv):
+def normalize_reference(reference):
     """
-    Turns a csv input string into a list
+    Normalize a single reference with one pass of REFERENCE_PATTERN, for example
+    BNC#123 or a Bugzilla URL to bsc#123. Unknown references are only stripped.
     """
-    if ',' in csv:
-        result = []
-        for item in csv.split(','):
-            result.append(item.strip())
-        return result
-    else:
-        return [csv.strip()]
+    reference = reference.strip()
+    match = REFERENCE_PATTERN.fullmatch(reference)
+    if match is None:
+        return reference
+    return REFERENCE_TYPES[match.lastgroup] + "#" + match.group(match.lastgroup)
+
+
+def normalize_many(references):
+    """
+    Normalize an iterable of references. Empty references are skipped.
+    """
+    result = []
+    for reference in references:
+        reference = normalize_reference(reference)
+        if reference:
+            result.append(reference)
+    return result
+
+
+def parse_message(text):
+    """
+    Parse a commit message in a single pass over its lines. Comment lines are skipped,
+    the first line is the subject and all lines up to the first trailer are the message.
+    Only the first occurrence of every trailer is used. Returns a ParsedMessage, doccommit
+    is True if the message has been created by git doccommit.
+    """
+    subject = None
+    message = []
+    fields = {}
+    doccommit = False
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        if line.startswith("~~"):
+            doccommit = doccommit or line.startswith(SIGNATURE)
+            continue
+        if subject is None:
+            if line.strip():
+                subject = line.strip()
+            continue
+        for prefix, key in TRAILERS:
+            if line.startswith(prefix):
+                fields.setdefault(key, line[len(prefix):].strip())
+                break
+        else:
+            if not fields:
+                message.append(line.strip())
+    return ParsedMessage(subject or "", "\n".join(message).strip(), fields.get("references", ""),
+                         fields.get("xml_ids", ""), fields.get("merge_commits", ""), doccommit)
+
+
+def split_list(csv):
+    """
+    Turns a csv input string into a tuple without empty items
+    """
+    return tuple(item.strip() for item in csv.split(",") if item.strip())
+
+
+def timed_check(name, check, parent=None):
+    """
+    Run a check function and return its CheckResult. parent is the span of the thread
+    that started the check.
+    """
+    with trace.span("check." + name, parent):
+        start = time.perf_counter()
+        problems = check()
+    return CheckResult(name, problems, time.perf_counter() - start)
+
+
+def check_subject(subject):
+    """
+    Returns the problems of a subject
+    """
+    problems = []
+    if len(subject) > 50:
+        problems.append("Subject longer than 50 characters.")
+    keywords = ['Add', 'Remove', 'Change']
+    if not any(keyword in subject for keyword in keywords):
+        problems.append("No keyword found in subject.")
+    return problems
+
+
+def check_message(message, subject):
+    """
+    Returns the problems of a message text
+    """
+    problems = []
+    if len(message) < len(subject):
+        problems.append("Subject is longer than description text.")
+    for line in message.splitlines():
+        if len(line) > 72:
+            problems.append("Message line longer than 72 characters.")
+    return problems
+
+
+def check_reference(reference):
+    """
+    Returns the problems of a single reference, it has to be formatted as SOURCE#ID
+    """
+    # gh ?
+    # trello ? often private
+    # open tracker bug for all sources that are not covered
+    problems = []
+    ref_type, _, ref_id = reference.partition('#')
+    if ref_type not in VALID_REFERENCES:
+        problems.append(reference+": Unknown reference type.")
+    if not ref_id.isdigit():
+        problems.append(reference+": Reference ID is not a number.")
+    return problems
+
+
+def check_references(references):
+    """
+    Returns the problems of a tuple of normalized references
+    """
+    if references == ('MINOR', ):
+        return []
+    if not any('#' in reference for reference in references):
+        return ["Reference does not contain a number (#) sign."]
+    problems = []
+    for reference in references:
+        problems.extend(check_reference(reference))
+    return problems
+
+
+def check_xml_ids(xml_ids, known_ids=None):
+    """
+    Returns the problems of a tuple of XML IDs. They are only looked up if a collection
+    of known IDs is passed.
+    """
+    if not xml_ids:
+        return ["No XML IDs entered."]
+    if known_ids is None:
+        return []
+    return [xml_id + " does not exist." for xml_id in xml_ids if xml_id not in known_ids]
+
+
+def check_merge_commits(merge_commits, resolve_commits=None):
+    """
+    Returns the problems of a tuple of merge commit hashes. resolve_commits is a function
+    like DocRepo.resolve_commits that checks all hashes at once.
+    """
+    if resolve_commits is None or not merge_commits:
+        return []
+    resolution = resolve_commits(merge_commits)
+    return ([commit + " is ambiguous, use a longer commit ID." for commit in resolution.ambiguous] +
+            [commit + " is not a valid commit ID." for commit in resolution.missing])
+
+
+def validate_commit(record, known_ids=None, resolve_commits=None):
+    """
+    Returns all problems of a DocCommit. XML IDs and merge commits are only checked if
+    known_ids and resolve_commits are passed.
+    """
+    problems = check_subject(record.subject)
+    problems.extend(check_message(record.message, record.subject))
+    problems.extend(check_references(record.references))
+    problems.extend(check_xml_ids(record.xml_ids, known_ids))
+    problems.extend(check_merge_commits(record.merge_commits, resolve_commits))
+    return problems
+
+
+def format_commit(record, comments=False):
+    """
+    Create the commit message of a DocCommit. With comments, the help texts for the
+    editor are included.
+    """
+    parts = []
+    if comments:
+        parts.append(subject_info + "\n")
+    parts.append(record.subject + "\n\n")
+    if comments:
+        parts.append(message_info + "\n")
+    parts.append(record.message + "\n\n")
+    if comments:
+        parts.append(reference_info + "\n")
+    parts.append("References: " + ", ".join(record.references) + "\n")
+    if comments:
+        parts.append("\n" + id_info + "\n")
+    parts.append("XML IDs: " + ", ".join(record.xml_ids) + "\n")
+    if comments:
+        parts.append("\n" + commit_info + "\n")
+    if comments or record.merge_commits:
+        parts.append("DocUpdate Merge: " + ", ".join(record.merge_commits))
+    parts.append("\n~~ created by git-doccommit version 1.0.5")
+    return "".join(parts)
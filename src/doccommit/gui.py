@@ -3,7 +3,6 @@ Classes and methods used for interactive mode
 """
 import subprocess
 import os
-from dialog import Dialog
 
 
 subject_info = """# Insert subject. Use
@@ -40,11 +39,13 @@ class commitGUI():
     The input will be validated immediatly.
     """
     def __init__(self, commit_message, args):
+        from dialog import Dialog
         self.commit_message = commit_message
         self.d = Dialog(dialog="dialog")
         self.d.set_background_title("Git commit for SUSE documentation")
         self.interactive = True if args.interactive is True else False
         self.editor = True if args.editor is True else False
+        self.diff_lines = args.diff_lines
         self.argument_files(args)
 
 
@@ -53,40 +54,31 @@ class commitGUI():
         Parse argument files and paths
         """
         if args.files is not None:
-            for file in args.files:
-                if os.path.isfile(file):
-                    self.commit_message.docrepo.stage_add_file(file)
-                elif os.path.isdir(file) and not file == '.':
-                    for root, dirs, files in os.walk(file):
-                        for walkfile in files:
-                            self.commit_message.docrepo.stage_add_file(root+walkfile)
+            self.commit_message.docrepo.stage_add_files(
+                [file for file in args.files
+                 if os.path.isfile(file) or (os.path.isdir(file) and not file == '.')])
 
 
     def select_files(self):
         """
         Dialog widget with file selection
         """
-        all_files = []
-        for filename, status in self.commit_message.docrepo.stage():
-            all_files.append(filename)
+        all_files = list(self.commit_message.docrepo.stage())
         if not all_files:
             print("No changed files in repository. Exiting ...")
             self.commit_message.docrepo.reset_repo()
             quit()
         code, filenames = self.d.checklist("Select files",
                                            choices=[(filename, "", status) for filename,
-                                                    status in self.commit_message.docrepo.stage()],
+                                                    status in all_files],
                                            title="Select the files that should be committed.")
         if code == "cancel":
             self.commit_message.docrepo.reset_repo()
             quit()
         else:
             self.commit_message.docrepo.reset_repo()
-            got_file = False
-            for filename in filenames:
-                self.commit_message.docrepo.stage_add_file(filename)
-                got_file = True
-            if got_file:
+            if filenames:
+                self.commit_message.docrepo.stage_add_files(filenames)
                 self.show_diff()
             else:
                 print("No files selected.")
@@ -97,7 +89,8 @@ class commitGUI():
         """
         Show the diff of staged files
         """
-        self.d.scrollbox(self.commit_message.docrepo.diff(True), height=30, width=78, \
+        preview = self.commit_message.docrepo.diff_preview(True, self.diff_lines)
+        self.d.scrollbox("\n".join(preview), height=30, width=78, \
                          title="Diff of staged files")
         self.enter_subject()
 
@@ -214,13 +207,26 @@ class commitGUI():
         self.final_check()
 
 
+    def show_check(self, result):
+        """
+        Show the result of a finished check while slower checks are still running
+        """
+        status = "ok" if not result.problems else str(len(result.problems)) + " problem(s)"
+        self.check_results.append("* {0}: {1} ({2:.0f} ms)".format(result.name, status,
+                                                                    result.seconds * 1000))
+        self.d.infobox("Checking input ...\n\n" + "\n".join(self.check_results),
+                       height=12, width=56)
+
+
     def final_check(self):
         """
         Format commit message and display either in dialog or in editor
         """
         text = ""
+        self.check_results = []
+        report = self.show_check if self.interactive and not self.editor else None
         if not self.commit_message.format(self.editor or
-                                          (not self.interactive and not self.editor)):
+                                          (not self.interactive and not self.editor), report):
             text = """#
 #          !!!  WARNING  !!!
 #
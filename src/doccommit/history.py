@@ -0,0 +1,312 @@
+"""
+Creates doc update sections from the commit history. The history is processed as a
+pipeline of generators: commits -> parsed doccommit entries -> merged items -> DocBook.
+"""
+import collections
+import json
+import os
+import pygit2
+from xml.sax.saxutils import escape
+from doccommit import trace
+from doccommit.git import DocCommit
+
+REFERENCE_URLS = {"bsc": "https://bugzilla.suse.com/show_bug.cgi?id=",
+                  "FATE": "https://fate.suse.com/",
+                  "dc": "https://doccomments.provo.novell.com/33098/"}
+
+class Checkpoint():
+    """
+    The last processed commit together with the entries of all commits up to it,
+    usually stored in .git/doccommit/. It allows to only parse new commits.
+    """
+    version = 1
+
+    def __init__(self, cache_dir=None):
+        self.path = os.path.join(cache_dir, "docupdate.json") if cache_dir else None
+        self.oid = None
+        self.entries = []
+        self.load()
+
+
+    def load(self):
+        """
+        Read the checkpoint file. A missing or broken file results in an empty checkpoint.
+        """
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'r') as checkpoint_file:
+                data = json.load(checkpoint_file)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != self.version:
+            return
+        try:
+            last = data["oid"]
+            entries = [DocCommit(oid, subject, message, tuple(references), tuple(xml_ids),
+                                 tuple(merge_commits))
+                       for oid, subject, message, references, xml_ids, merge_commits
+                       in data["entries"]]
+        except (KeyError, TypeError, ValueError):
+            return
+        self.oid = last
+        self.entries = entries
+
+
+    def save(self):
+        """
+        Write the checkpoint file
+        """
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", 'w') as checkpoint_file:
+                json.dump({"version": self.version, "oid": self.oid, "entries": self.entries},
+                          checkpoint_file)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            return
+
+
+class TrailerIndex():
+    """
+    Inverted index from references and XML IDs to the commits that mention them, stored
+    in an SQLite database in .git/doccommit/. It is updated incrementally with the
+    commits that have been added since the last update.
+    """
+    def __init__(self, cache_dir=None):
+        import sqlite3
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(cache_dir, "trailers.sqlite"))
+        else:
+            self.db = sqlite3.connect(":memory:")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS trailers (value TEXT, kind TEXT, oid TEXT,
+                                                 position INTEGER);
+            CREATE INDEX IF NOT EXISTS trailers_value ON trailers (value, position);
+        """)
+
+
+    def head(self):
+        """
+        Returns the last indexed commit ID or None
+        """
+        row = self.db.execute("SELECT value FROM state WHERE key = 'head'").fetchone()
+        return row[0] if row else None
+
+
+    def update(self, repo, rev="HEAD"):
+        """
+        Add the trailers of all commits that are new since the last update. If the
+        history has been rewritten, the index is built again.
+        """
+        head, since = new_commits(repo, rev, self.head())
+        if head == since:
+            return
+        if since is None:
+            self.db.execute("DELETE FROM trailers")
+        position = self.db.execute("SELECT COALESCE(MAX(position), 0) FROM trailers").fetchone()[0]
+        entries = list(iter_entries(iter_commits(repo, rev, since)))
+        rows = []
+        for number, entry in enumerate(entries):
+            for kind, values in (("reference", entry.references), ("xml_id", entry.xml_ids)):
+                for value in values:
+                    rows.append((value, kind, entry.oid, position + len(entries) - number))
+        self.db.executemany("INSERT INTO trailers VALUES (?, ?, ?, ?)", rows)
+        self.db.execute("INSERT OR REPLACE INTO state VALUES ('head', ?)", (head, ))
+        self.db.commit()
+
+
+    def query(self, value):
+        """
+        Returns the IDs of all commits with a reference or XML ID, newest first
+        """
+        return [row[0] for row in self.db.execute(
+            "SELECT DISTINCT oid FROM trailers WHERE value = ? ORDER BY position DESC",
+            (value, ))]
+
+
+    def close(self):
+        self.db.close()
+
+
+def iter_commits(repo, rev="HEAD", since=None):
+    """
+    Iterate over all commits reachable from rev, newest first. Commits reachable from
+    the commit ID since are skipped.
+    """
+    start = repo.revparse_single(rev).peel(pygit2.Commit)
+    walker = repo.walk(start.id, pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_TIME)
+    if since is not None:
+        walker.hide(since)
+    for commit in walker:
+        yield commit
+
+
+def new_commits(repo, rev, last):
+    """
+    Returns the ID of the commit rev and the commit ID since which commits are new. since
+    is last if rev is last or a descendant of it, and None if all commits are new, e.g.
+    because the history has been rewritten.
+    """
+    head = str(repo.revparse_single(rev).peel(pygit2.Commit).id)
+    if last is None or last == head:
+        return head, last
+    try:
+        if repo.descendant_of(head, last):
+            return head, last
+    except (KeyError, ValueError, pygit2.GitError):
+        pass
+    return head, None
+
+
+def collect_entries(repo, rev="HEAD", checkpoint=None):
+    """
+    Returns the entries of all commits reachable from rev, newest first. If a checkpoint
+    is passed, only commits after it are parsed and the checkpoint is updated. If the
+    history has been rewritten since the checkpoint, all commits are parsed again.
+    """
+    if checkpoint is None:
+        return list(iter_entries(iter_commits(repo, rev)))
+    head, since = new_commits(repo, rev, checkpoint.oid)
+    if head == since:
+        return checkpoint.entries
+    entries = list(iter_entries(iter_commits(repo, rev, since)))
+    if since is not None:
+        entries.extend(checkpoint.entries)
+    checkpoint.oid = head
+    checkpoint.entries = entries
+    checkpoint.save()
+    return entries
+
+
+def iter_entries(commits):
+    """
+    Iterate over the DocCommit of every commit created by git doccommit
+    """
+    for commit in commits:
+        entry = DocCommit.from_message(str(commit.id), commit.message)
+        if entry is not None:
+            yield entry
+
+
+def merge_entries(entries, resolve):
+    """
+    Merge entries that are linked with DocUpdate Merge or that share a reference into one
+    item. MINOR entries are skipped. resolve turns a (short) commit hash into the full
+    commit ID or None. Returns lists of entries, in the order of their newest entry.
+    """
+    parent = {}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def union(first, second):
+        parent.setdefault(first, first)
+        parent.setdefault(second, second)
+        parent[find(second)] = find(first)
+
+    order = []
+    for entry in entries:
+        if entry.references == ("MINOR", ):
+            continue
+        order.append(entry)
+        parent.setdefault(entry.oid, entry.oid)
+        for reference in entry.references:
+            union(entry.oid, "ref:" + reference)
+        for commit in entry.merge_commits:
+            oid = resolve(commit)
+            if oid is not None:
+                union(entry.oid, oid)
+
+    items = collections.OrderedDict()
+    for entry in order:
+        items.setdefault(find(entry.oid), []).append(entry)
+    return list(items.values())
+
+
+def format_reference(reference):
+    """
+    DocBook link for a reference
+    """
+    ref_type, _, ref_id = reference.partition("#")
+    if ref_type not in REFERENCE_URLS or not ref_id.isdigit():
+        return escape(reference)
+    return '<link xlink:href="{0}{1}">{2}</link>'.format(REFERENCE_URLS[ref_type], ref_id,
+                                                         escape(reference))
+
+
+def format_message(entry):
+    """
+    Turn the message of an entry into DocBook paragraphs. ## is replaced with the
+    references, @@ with the XML IDs and @ID with a link to the ID.
+    """
+    references = ", ".join(format_reference(reference) for reference in entry.references)
+    xml_ids = ", ".join('<xref linkend="{0}"/>'.format(escape(xml_id))
+                        for xml_id in entry.xml_ids)
+    paragraphs = []
+    for paragraph in entry.message.split("\n\n"):
+        words = []
+        for word in escape(" ".join(paragraph.split())).split(" "):
+            if word == "##":
+                word = references
+            elif word == "@@":
+                word = xml_ids
+            elif word.startswith("@") and len(word.rstrip(".,;:!?)")) > 1:
+                xml_id = word[1:].rstrip(".,;:!?)")
+                word = '<xref linkend="{0}"/>'.format(xml_id) + word[len(xml_id) + 1:]
+            words.append(word)
+        if any(words):
+            paragraphs.append("<para>" + " ".join(words) + "</para>")
+    return paragraphs
+
+
+def iter_section(items, title="Documentation Updates", section_id="sec.docupdates"):
+    """
+    Iterate over the lines of a DocBook section with one list item per merged item
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>'
+    yield ('<sect1 xmlns="http://docbook.org/ns/docbook" ' +
+           'xmlns:xlink="http://www.w3.org/1999/xlink" version="5.0" xml:id="{0}">'.format(
+               section_id))
+    yield " <title>{0}</title>".format(escape(title))
+    if not items:
+        yield " <para>No documentation updates.</para>"
+        yield "</sect1>"
+        return
+    yield " <itemizedlist>"
+    for item in items:
+        references = []
+        for entry in item:
+            for reference in entry.references:
+                if reference not in references:
+                    references.append(reference)
+        yield "  <listitem>"
+        for entry in reversed(item):
+            for paragraph in format_message(entry):
+                yield "   " + paragraph
+        if references:
+            yield "   <para>(" + ", ".join(format_reference(reference)
+                                            for reference in references) + ")</para>"
+        yield "  </listitem>"
+    yield " </itemizedlist>"
+    yield "</sect1>"
+
+
+def docupdate(docrepo, rev="HEAD", checkpoint=None):
+    """
+    Iterate over the lines of the doc update section of all commits reachable from rev.
+    With a Checkpoint, only commits that are new since the last run are parsed.
+    """
+    with trace.span("history.collect_entries"):
+        entries = collect_entries(docrepo.repo, rev, checkpoint)
+    commit_hashes = set(commit for entry in entries for commit in entry.merge_commits)
+    with trace.span("history.resolve_commits"):
+        resolved = docrepo.resolve_commits(sorted(commit_hashes)).resolved
+    return iter_section(merge_entries(entries, resolved.get))
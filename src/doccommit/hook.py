@@ -0,0 +1,211 @@
+"""
+Git hooks that enforce the doccommit format on commits created with plain git commit.
+Install the commit-msg hook with a .git/hooks/commit-msg script that runs:
+
+    exec git doccommit --hook commit-msg "$1"
+
+Hooks never show a dialog and never parse the whole XML source. XML IDs are looked up
+in the index kept by a running daemon or in the persistent cache in .git/doccommit/.
+
+On central repositories, the pre-receive hook rejects pushes with invalid commits:
+
+    exec git doccommit --hook pre-receive
+
+In CI, a range of commits can be checked with git doccommit --range OLD..NEW. The XML
+IDs of every commit are checked against the tree of that commit.
+"""
+import collections
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import pygit2
+from doccommit import daemon
+from doccommit import git
+from doccommit import trace
+from doccommit import xml
+
+# messages created by git itself that are not checked
+SKIPPED_PREFIXES = ("Merge ", "Revert \"", "fixup! ", "squash! ", "amend! ")
+
+# problems of a commit in a range
+RangeResult = collections.namedtuple("RangeResult", "oid subject problems")
+
+
+def print_problem(problem):
+    print(problem, file=sys.stderr)
+
+
+def commit_msg(docrepo, filename, report=print_problem):
+    """
+    Validate the commit message in a file. XML IDs are only looked up if the staged
+    changes touch the xml folder. report is called with every problem. Returns True if
+    the message is valid.
+    """
+    with open(filename, 'r') as message_file:
+        text = message_file.read()
+    if text.lstrip().startswith(SKIPPED_PREFIXES):
+        return True
+    xml_index = xml.XmlIdIndex(os.path.join(docrepo.repo.workdir, "xml") + "/",
+                               os.path.join(docrepo.repo.path, "doccommit"),
+                               daemon_socket=daemon.socket_path(docrepo), prebuilt=True)
+    commit_message = git.CommitMessage(docrepo, commit_text=text, xml_index=xml_index)
+    with trace.span("staged_changes"):
+        commit_message.lookup_xml_ids = docrepo.staged_changes("xml")
+    valid = commit_message.validate()
+    for problem in commit_message.problems:
+        report(problem)
+    return valid
+
+
+def is_null(oid):
+    return set(oid) == {"0"}
+
+
+def iter_range(repo, old, new):
+    """
+    Iterate over the commits reachable from new but not from old, oldest first. If old
+    is None, the commits reachable from any reference are skipped, as for a new branch
+    in a pre-receive hook.
+    """
+    walker = repo.walk(repo.revparse_single(new).peel(pygit2.Commit).id,
+                       pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_REVERSE)
+    if old is not None:
+        walker.hide(repo.revparse_single(old).peel(pygit2.Commit).id)
+    else:
+        for name in repo.references:
+            try:
+                walker.hide(repo.references[name].peel(pygit2.Commit).id)
+            except (KeyError, ValueError, pygit2.GitError):
+                continue
+    for commit in walker:
+        yield commit
+
+
+def validate_range(docrepo, old, new, workers=None):
+    """
+    Validate all commits reachable from new but not from old. The XML IDs of a commit are
+    checked against the tree of that commit. The trees are read in several threads and
+    the DocBook files are parsed once per blob. Returns a RangeResult for every invalid
+    commit, oldest first.
+    """
+    records = []
+    for commit in iter_range(docrepo.repo, old, new):
+        if len(commit.parents) > 1 or commit.message.lstrip().startswith(SKIPPED_PREFIXES):
+            continue
+        record = git.DocCommit.from_parsed(str(commit.id), git.parse_message(commit.message))
+        try:
+            xml_tree = str(commit.tree["xml"].id)
+        except KeyError:
+            xml_tree = None
+        records.append((record, xml_tree))
+
+    # one lookup for all merge commits, later lookups are answered from the cache
+    with trace.span("resolve_commits"):
+        docrepo.resolve_commits(sorted(set(commit for record, _ in records
+                                           for commit in record.merge_commits)))
+
+    # the XML IDs only have to be collected once for every version of the xml folder
+    trees = collections.OrderedDict()
+    for record, xml_tree in records:
+        if record.xml_ids and xml_tree is not None:
+            trees.setdefault(xml_tree, record.oid)
+    cache = git.BlobIdCache(None, os.path.join(docrepo.repo.path, "doccommit"))
+    with trace.span("xml_ids", trees=len(trees)):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            known_ids = dict(zip(trees, executor.map(lambda oid: docrepo.xml_ids(oid, cache),
+                                                     trees.values())))
+    cache.prune(())
+    cache.save()
+
+    results = []
+    for record, xml_tree in records:
+        problems = git.validate_commit(record, known_ids.get(xml_tree, {}),
+                                       docrepo.resolve_commits)
+        if problems:
+            results.append(RangeResult(record.oid, record.subject, problems))
+    return results
+
+
+def report_range(results, report=print_problem):
+    """
+    Report the problems of all invalid commits
+    """
+    for result in results:
+        report("{0} {1}".format(result.oid[:12], result.subject))
+        for problem in result.problems:
+            report("    " + problem)
+
+
+def check_range(docrepo, revision_range, workers=None, report=print_problem):
+    """
+    Validate the commits of a range OLD..NEW. Returns True if all commits are valid.
+    """
+    old, separator, new = revision_range.partition("..")
+    if not separator or not old or not new:
+        report("Use a range like OLD..NEW.")
+        return False
+    try:
+        results = validate_range(docrepo, old, new, workers)
+    except (KeyError, ValueError, pygit2.GitError) as error:
+        report("Invalid range " + revision_range + ": " + str(error))
+        return False
+    report_range(results, report)
+    return not results
+
+
+def add_quarantine(repo):
+    """
+    Make the pushed objects readable. git keeps them in a quarantine directory until the
+    pre-receive hook accepts them, but libgit2 does not read the environment variables
+    that point to it.
+    """
+    directories = [os.environ.get("GIT_QUARANTINE_PATH"),
+                   os.environ.get("GIT_OBJECT_DIRECTORY")]
+    directories.extend(os.environ.get("GIT_ALTERNATE_OBJECT_DIRECTORIES", "").split(os.pathsep))
+    known = set([os.path.realpath(os.path.join(repo.path, "objects"))])
+    for directory in directories:
+        if not directory or not os.path.isdir(directory):
+            continue
+        directory = os.path.realpath(directory)
+        if directory not in known:
+            known.add(directory)
+            repo.odb.add_disk_alternate(directory)
+
+
+def pre_receive(docrepo, lines, workers=None, report=print_problem):
+    """
+    Validate the pushed commits. Every line is "OLD NEW REFERENCE" as git passes it to
+    the pre-receive hook. Returns True if all commits are valid.
+    """
+    add_quarantine(docrepo.repo)
+    valid = True
+    for line in lines:
+        if not line.strip():
+            continue
+        old, new, reference = line.split(None, 2)
+        if is_null(new):
+            continue
+        try:
+            results = validate_range(docrepo, None if is_null(old) else old, new, workers)
+        except (KeyError, ValueError, pygit2.GitError) as error:
+            report("Could not check " + reference.strip() + ": " + str(error))
+            valid = False
+            continue
+        report_range(results, report)
+        valid = valid and not results
+    return valid
+
+
+def run(docrepo, hook, args, workers=None):
+    """
+    Run a hook with the arguments git passes to it. Returns True on success.
+    """
+    if hook == "commit-msg":
+        if not args:
+            print("The commit-msg hook needs the commit message file.", file=sys.stderr)
+            return False
+        return commit_msg(docrepo, args[0])
+    if hook == "pre-receive":
+        return pre_receive(docrepo, sys.stdin, workers)
+    print("Unknown hook " + hook + ".", file=sys.stderr)
+    return False
@@ -0,0 +1,150 @@
+"""
+Timing of the phases of a command. Phases are marked with named spans that can be
+nested. When tracing is enabled with --trace FILE or the environment variable
+DOCCOMMIT_TRACE=FILE, all spans are written to FILE in the Chrome trace event format,
+which can be opened in chrome://tracing or https://ui.perfetto.dev. One phase can be
+profiled with cProfile, the statistics are written to FILE.PHASE.prof.
+"""
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+
+tracer = None
+
+
+class Tracer():
+    """
+    Collects the spans of all threads of the process
+    """
+    def __init__(self, filename, profile=None):
+        self.filename = filename
+        self.profile = profile
+        self.profiled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+
+    @contextlib.contextmanager
+    def span(self, name, args, parent=None):
+        """
+        Record the duration of the enclosed code as complete event. The parent is the
+        enclosing span of the thread, unless it is passed, e.g. from another thread.
+        """
+        stack = self.local.__dict__.setdefault("stack", [])
+        if parent is None and stack:
+            parent = stack[-1]
+        if parent is not None:
+            args = dict(args, parent=parent)
+        stack.append(name)
+        profiler = self.start_profile(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats("{0}.{1}.prof".format(self.filename, name))
+            with self.lock:
+                self.events.append({"name": name, "cat": "doccommit", "ph": "X",
+                                    "ts": start * 1000000, "dur": duration * 1000000,
+                                    "pid": os.getpid(), "tid": threading.get_ident(),
+                                    "args": args})
+
+
+    def current(self):
+        """
+        Returns the name of the innermost span of the thread or None
+        """
+        stack = self.local.__dict__.get("stack")
+        return stack[-1] if stack else None
+
+
+    def start_profile(self, name):
+        """
+        Start cProfile for the first span of the profiled phase. Returns the profiler or
+        None.
+        """
+        if name != self.profile:
+            return None
+        with self.lock:
+            if self.profiled:
+                return None
+            self.profiled = True
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is already running
+            return None
+        return profiler
+
+
+    def save(self):
+        """
+        Write all finished spans to the trace file
+        """
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+        try:
+            with open(self.filename, 'w') as trace_file:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+        except OSError as error:
+            print("Could not write trace file: " + str(error))
+
+
+def enable(filename, profile=None):
+    """
+    Record all spans and write them to filename when the process exits
+    """
+    global tracer
+    tracer = Tracer(filename, profile)
+    atexit.register(tracer.save)
+    return tracer
+
+
+def enable_from_args(args):
+    """
+    Enable tracing with the --trace and --profile options or the environment variables
+    DOCCOMMIT_TRACE and DOCCOMMIT_PROFILE
+    """
+    filename = getattr(args, "trace", None) or os.environ.get("DOCCOMMIT_TRACE")
+    profile = getattr(args, "profile", None) or os.environ.get("DOCCOMMIT_PROFILE")
+    if filename:
+        return enable(filename, profile)
+    return None
+
+
+def disable():
+    """
+    Stop recording spans. Spans that have been recorded are written nevertheless.
+    """
+    global tracer
+    tracer = None
+
+
+def current():
+    """
+    Returns the name of the innermost span of the thread, to be passed as parent to
+    spans in other threads. None if there is no span or tracing is not enabled.
+    """
+    return tracer.current() if tracer is not None else None
+
+
+@contextlib.contextmanager
+def span(name, parent=None, **args):
+    """
+    Mark a phase. Spans started in worker threads need the parent of the thread that
+    started them. Does nothing if tracing is not enabled.
+    """
+    if tracer is None:
+        yield
+        return
+    with tracer.span(name, args, parent):
+        yield
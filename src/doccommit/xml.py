@@ -1,23 +1,550 @@
 """
 Contains helper classes and functions for DocBook XML
 """
+import json
+import os
+import re
+import threading
+from doccommit import trace
 
-def get_source_xml_ids(xml_source_ids):
+DOCBOOK_NS = "http://docbook.org/ns/docbook"
+XINCLUDE_NS = "http://www.w3.org/2001/XInclude"
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+
+
+class IdCache():
     """
-    Get all XML IDs from DocBook source. This can be executed in a thread.
-    The parameter is a pointer to variable that stores the result.
+    Persistent index of the XML IDs and XIncludes of every DocBook file, usually stored in
+    .git/doccommit/. Every file is stored with its mtime and size, so only files that
+    changed since the last run are parsed again.
+    """
+    version = 2
+    filename = "xml-ids.json"
+
+    def __init__(self, cache_dir=None):
+        self.path = os.path.join(cache_dir, self.filename) if cache_dir else None
+        self.files = {}
+        self.changed = False
+        self.load()
+
+
+    def load(self):
+        """
+        Read the cache file. A missing or broken cache file results in an empty cache.
+        """
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'r') as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("version") == self.version:
+            self.files = data.get("files", {})
+
+
+    def save(self):
+        """
+        Write the cache file if anything changed since it has been loaded.
+        """
+        if self.path is None or not self.changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", 'w') as cache_file:
+                json.dump({"version": self.version, "files": self.files}, cache_file)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            return
+        self.changed = False
+
+
+    def lookup(self, filename):
+        """
+        Returns the cached ([id, title] list, include list) of a file, or None if the
+        file is unknown or changed.
+        """
+        entry = self.files.get(filename)
+        if entry is None or file_stamp(filename) != entry["stamp"]:
+            return None
+        return entry["ids"], entry["includes"]
+
+
+    def store(self, filename, ids, includes):
+        """
+        Store the IDs and XIncludes of a file together with its stamp.
+        """
+        self.files[filename] = {"stamp": file_stamp(filename), "ids": ids, "includes": includes}
+        self.changed = True
+
+
+    def prune(self, filenames):
+        """
+        Remove files that are not part of any book anymore.
+        """
+        for filename in list(self.files):
+            if filename not in filenames:
+                del self.files[filename]
+                self.changed = True
+
+
+class XmlIdIndex():
+    """
+    Index of all XML IDs of an xml folder that can be shared by several commit messages.
+    Nothing is parsed before it is used. Single IDs are looked up in a running daemon,
+    the persistent IdCache or with a text search, before the complete index is built.
+    """
+    def __init__(self, path, cache_dir=None, workers=None, daemon_socket=None, prebuilt=False):
+        self.path = path
+        # only use the daemon, the persistent cache and the text search, never parse
+        # the whole source
+        self.prebuilt = prebuilt
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.daemon_socket = daemon_socket
+        self.xml_source_ids = {}
+        self.thread = None
+        # the exception that stopped the build, if any
+        self.error = None
+        self.lock = threading.Lock()
+
+
+    def start(self):
+        """
+        Start building the complete index in the background, unless a daemon is running
+        """
+        if self.thread is None and not self.daemon_running():
+            self.build()
+
+
+    def build(self):
+        """
+        Start building the complete index in a thread, if that has not happened yet.
+        Returns the thread.
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run_build, args=(trace.current(), ))
+                self.thread.start()
+        return self.thread
+
+
+    def run_build(self, parent=None):
+        """
+        Build the complete index. An exception is stored instead of being raised in the
+        thread. parent is the span of the thread that started the build.
+        """
+        try:
+            with trace.span("xml.build", parent):
+                get_source_xml_ids(self.xml_source_ids, self.cache_dir, self.workers,
+                                   self.path)
+        except Exception as error:
+            self.error = error
+
+
+    def complete(self):
+        """
+        Check if the complete index has been built successfully
+        """
+        return self.thread is not None and not self.thread.is_alive() and self.error is None
+
+
+    def failed(self):
+        """
+        Check if building the complete index failed
+        """
+        return self.thread is not None and not self.thread.is_alive() and \
+            self.error is not None
+
+
+    def ids(self):
+        """
+        Returns the dict of all XML IDs and their titles. Waits until it is complete and
+        raises the exception that stopped the build, if any.
+        """
+        self.build().join()
+        if self.error is not None:
+            raise self.error
+        return self.xml_source_ids
+
+
+    def daemon_running(self):
+        """
+        Check if a daemon answers lookups for this index
+        """
+        from doccommit import daemon
+        return self.daemon_socket is not None and daemon.is_running(self.daemon_socket)
+
+
+    def find(self, xml_ids):
+        """
+        Returns the IDs out of xml_ids that exist in the XML source. The daemon, the
+        persistent cache and a text search are tried first. The complete index is only
+        built if an ID can not be found that way or if it appears in several files. If
+        building the index failed, the result of the text search is used.
+        """
+        if self.complete():
+            return self.xml_source_ids
+        if self.daemon_socket is not None:
+            from doccommit import daemon
+            with trace.span("xml.find.daemon"):
+                known_ids = daemon.lookup_xml_ids(self.daemon_socket, xml_ids)
+            if known_ids is not None:
+                return known_ids
+        with trace.span("xml.find.cache"):
+            known_ids = lookup_cached_ids(self.path, self.cache_dir, xml_ids)
+        if known_ids is not None:
+            return known_ids
+        with trace.span("xml.find.scan"):
+            found = scan_xml_ids(self.path, xml_ids)
+        if all(len(files) == 1 for files in found.values()):
+            return found
+        if not self.prebuilt and not self.failed():
+            with trace.span("xml.find.wait"):
+                self.build().join()
+            if self.complete():
+                return self.xml_source_ids
+        # without a complete index, IDs found by the text search are trusted
+        return {xml_id: files for xml_id, files in found.items() if files}
+
+
+shared_indexes = {}
+shared_indexes_lock = threading.Lock()
+
+
+def shared_index(path, cache_dir=None, workers=None, daemon_socket=None):
+    """
+    Returns the XmlIdIndex of an xml folder that is shared by the whole process
+    """
+    with shared_indexes_lock:
+        if (path, cache_dir) not in shared_indexes:
+            shared_indexes[(path, cache_dir)] = XmlIdIndex(path, cache_dir, workers, daemon_socket)
+        return shared_indexes[(path, cache_dir)]
+
+
+class IncludeGraph():
+    """
+    XInclude dependency graph of the DocBook source: MAIN file -> included files -> IDs.
+    Files are parsed one by one instead of resolving whole books, so every file is
+    parsed at most once, even if it is included by several books.
+    Files are read from disk, unless a read function is passed that returns the content
+    of a file as bytes, or None if it does not exist.
+    """
+    def __init__(self, cache=None, read=None):
+        self.cache = cache if cache is not None else IdCache()
+        self.read = read
+        self.books = []
+        self.includes = {}
+        self.ids = {}
+
+
+    def add_book(self, main_file):
+        """
+        Add a MAIN file and all files it includes to the graph.
+        """
+        self.books.append(main_file)
+        stack = [main_file]
+        while stack:
+            filename = stack.pop()
+            if filename in self.includes:
+                continue
+            self.load_file(filename)
+            stack.extend(reversed(self.includes[filename]))
+
+
+    def add_books(self, main_files, workers=None):
+        """
+        Add several MAIN files to the graph. If workers is greater than 1, all files that
+        are not cached are parsed in a pool of that many processes, one include level
+        at a time. The resulting graph is the same as with add_book.
+        """
+        if workers is None or workers < 2:
+            for main_file in main_files:
+                self.add_book(main_file)
+            return
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # the graph is often built in a background thread, forking a process with
+        # several threads can deadlock
+        context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+        executor = None
+        level = list(main_files)
+        try:
+            while level:
+                added = []
+                parse = []
+                for filename in level:
+                    if filename in self.includes:
+                        continue
+                    added.append(filename)
+                    cached = self.cache.lookup(filename)
+                    if cached is None:
+                        self.includes[filename] = []
+                        parse.append(filename)
+                    else:
+                        self.ids[filename], self.includes[filename] = cached
+                data = [None] * len(parse)
+                if self.read:
+                    data = [self.read(filename) for filename in parse]
+                    for filename, content in zip(parse, data):
+                        if content is None:
+                            self.add_parsed(filename, None)
+                    parse = [filename for filename, content in zip(parse, data)
+                             if content is not None]
+                    data = [content for content in data if content is not None]
+                if parse:
+                    if executor is None:
+                        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+                    results = executor.map(parse_file, parse, data,
+                                           chunksize=max(1, len(parse) // (workers * 4)))
+                    for filename, parsed in zip(parse, results):
+                        self.add_parsed(filename, parsed)
+                level = [include for filename in added for include in self.includes[filename]]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.books.extend(main_files)
+
+
+    def load_file(self, filename):
+        """
+        Get IDs and XIncludes of a single file from cache or by parsing it.
+        """
+        cached = self.cache.lookup(filename)
+        if cached is None and self.read:
+            data = self.read(filename)
+            self.add_parsed(filename, parse_file(filename, data) if data is not None else None)
+        elif cached is None:
+            self.add_parsed(filename, parse_file(filename))
+        else:
+            self.ids[filename], self.includes[filename] = cached
+
+
+    def add_parsed(self, filename, parsed):
+        """
+        Add the result of parse_file to the graph and the cache.
+        """
+        if parsed is None:
+            self.ids[filename], self.includes[filename] = [], []
+        else:
+            self.cache.store(filename, *parsed)
+            self.ids[filename], self.includes[filename] = parsed
+
+
+    def book_files(self, main_file):
+        """
+        Returns all files of a book in document order
+        """
+        result = []
+        seen = set()
+        stack = [main_file]
+        while stack:
+            filename = stack.pop()
+            if filename in seen:
+                continue
+            seen.add(filename)
+            result.append(filename)
+            stack.extend(reversed(self.includes.get(filename, [])))
+        return result
+
+
+    def affected_books(self, filename):
+        """
+        Returns all MAIN files that include a file, directly or indirectly
+        """
+        filename = os.path.normpath(filename)
+        if filename not in self.includes:
+            filename = os.path.abspath(filename)
+        return [book for book in self.books if filename in self.book_files(book)]
+
+
+    def xml_ids(self):
+        """
+        Iterate over (id, title, file) of all books. IDs in files that are included
+        several times are only returned once.
+        """
+        done = set()
+        for book in self.books:
+            for filename in self.book_files(book):
+                if filename in done:
+                    continue
+                done.add(filename)
+                for xml_id, title in self.ids[filename]:
+                    yield xml_id, title, filename
+
+
+def file_stamp(filename):
     """
-    import os
+    Returns [mtime, size] of a file or None if it does not exist
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def iter_xml_ids(filename, includes=None, data=None):
+    """
+    Stream (id, title, file) tuples of a single DocBook file in document order without
+    building the whole tree. Elements are cleared as soon as they have been processed,
+    so memory usage does not depend on the size of the file. XIncludes are not resolved,
+    but if a list is passed as includes, the files included as XML are appended to it.
+    If data is set, it is parsed instead of reading the file.
+    """
+    from collections import deque
+    from io import BytesIO
     from lxml import etree
-    path = str(os.getcwd())+"/xml/"
+    title_tag = "{%s}title" % DOCBOOK_NS
+    include_tag = "{%s}include" % XINCLUDE_NS
+    # [id, title, resolved] in document order, yielded as soon as the title is known
+    queue = deque()
+    open_ids = []
+    source = filename if data is None else BytesIO(data)
+    for event, element in etree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            xml_id = element.get(XML_ID)
+            if xml_id is not None:
+                record = [xml_id, None, False]
+                queue.append(record)
+                open_ids.append((element, record))
+            continue
+        if element.tag == title_tag and open_ids and element.getparent() is open_ids[-1][0]:
+            record = open_ids[-1][1]
+            if not record[2]:
+                record[1] = element.text or ""
+                record[2] = True
+        elif element.tag == include_tag and includes is not None:
+            href = element.get("href")
+            if href and element.get("parse", "xml") == "xml":
+                includes.append(os.path.normpath(os.path.join(os.path.dirname(filename),
+                                                              href)))
+        if open_ids and element is open_ids[-1][0]:
+            open_ids.pop()[1][2] = True
+        while queue and queue[0][2]:
+            xml_id, title, _ = queue.popleft()
+            yield xml_id, title, filename
+        element.clear()
+        # the root element has no parent, but comments and processing instructions
+        # before it are its siblings
+        if element.getparent() is not None:
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def parse_file(filename, data=None):
+    """
+    Parse a single DocBook file without resolving XIncludes. Returns a list of
+    [id, title] entries and the list of files included as XML, or None if the file
+    can not be read. If data is set, it is parsed instead of reading the file.
+    """
+    from lxml import etree
+    includes = []
     try:
-        for file in os.listdir(path):
-            if str(file).startswith("MAIN") and str(file).endswith(".xml"):
-                xml = etree.parse(path+str(file))
-                xml.xinclude()
-                for i in xml.xpath("//*[@xml:id]",
-                                   namespaces={'d': "http://docbook.org/ns/docbook"}):
-                    xml_source_ids[i.attrib['{http://www.w3.org/XML/1998/namespace}id']] = \
-                    i.findtext('d:title', namespaces={'d': "http://docbook.org/ns/docbook"})
+        ids = [[xml_id, title] for xml_id, title, _ in iter_xml_ids(filename, includes, data)]
+    except (OSError, etree.XMLSyntaxError):
+        return None
+    return ids, includes
+
+
+def find_main_files(path):
+    """
+    Returns the MAIN files in an xml folder, or None if the folder does not exist
+    """
+    try:
+        return [os.path.join(path, str(file)) for file in sorted(os.listdir(path))
+                if str(file).startswith("MAIN") and str(file).endswith(".xml")]
+    except FileNotFoundError:
+        return None
+
+
+def build_graph(path, cache, workers=None):
+    """
+    Build the IncludeGraph of all MAIN files in an xml folder and update the cache.
+    Returns None if the folder does not exist.
+    """
+    main_files = find_main_files(path)
+    if main_files is None:
+        return None
+    graph = IncludeGraph(cache)
+    graph.add_books(main_files, workers)
+    cache.prune(graph.includes)
+    cache.save()
+    return graph
+
+
+def lookup_cached_ids(path, cache_dir, xml_ids):
+    """
+    Look up XML IDs in the persistent IdCache without parsing anything. Returns a dict with
+    the titles of all IDs that exist in the books of an xml folder, or None if the cache
+    does not cover all files of the books or one of them changed.
+    """
+    main_files = find_main_files(path)
+    if main_files is None or cache_dir is None:
+        return None
+    cache = IdCache(cache_dir)
+    wanted = set(xml_ids)
+    known_ids = {}
+    seen = set()
+    stack = list(reversed(main_files))
+    while stack:
+        filename = stack.pop()
+        if filename in seen:
+            continue
+        seen.add(filename)
+        cached = cache.lookup(filename)
+        if cached is None:
+            return None
+        ids, includes = cached
+        for xml_id, title in ids:
+            if xml_id in wanted:
+                known_ids[xml_id] = title
+        stack.extend(reversed(includes))
+    return known_ids
+
+
+def scan_xml_ids(path, xml_ids):
+    """
+    Search the XML files of a folder for xml:id attributes with a regular expression
+    instead of parsing them. Returns a dict with a list of matching files for every ID.
+    IDs in files that are not part of a book are found, too.
+    """
+    found = {xml_id: [] for xml_id in xml_ids}
+    if not found:
+        return found
+    pattern = re.compile(rb"""xml:id\s*=\s*["'](""" +
+                         b"|".join(re.escape(xml_id.encode()) for xml_id in found) +
+                         rb""")["']""")
+    try:
+        files = sorted(file for file in os.listdir(path) if str(file).endswith(".xml"))
     except FileNotFoundError:
-        xml_source_ids = {}
+        return found
+    for file in files:
+        try:
+            with open(os.path.join(path, file), 'rb') as xml_file:
+                content = xml_file.read()
+        except OSError:
+            continue
+        for xml_id in set(match.group(1).decode() for match in pattern.finditer(content)):
+            found[xml_id].append(os.path.join(path, file))
+    return found
+
+
+def get_source_xml_ids(xml_source_ids, cache_dir=None, workers=None, path=None):
+    """
+    Get all XML IDs from DocBook source. This can be executed in a thread.
+    The parameter is a pointer to variable that stores the result.
+    If cache_dir is set, the IDs are stored in a persistent IdCache and unchanged
+    files are not parsed again. With workers > 1, files are parsed in several processes.
+    path is the xml folder, by default the one in the working directory.
+    """
+    if path is None:
+        path = str(os.getcwd())+"/xml/"
+    with trace.span("xml.get_source_xml_ids", path=path):
+        graph = build_graph(path, IdCache(cache_dir), workers)
+        if graph is None:
+            return None
+        for xml_id, title, _ in graph.xml_ids():
+            xml_source_ids[xml_id] = title
+    return graph
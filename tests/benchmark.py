@@ -0,0 +1,238 @@
+"""
+Benchmarks with synthetic SUSE-style documentation repositories. A repository has DC
+files, xml/MAIN*.xml books with deep XInclude trees, many XML IDs, images and a long
+history of commits created by git doccommit.
+
+Run it with: python tests/benchmark.py --sizes small,medium --repeat 3
+"""
+import argparse
+import collections
+import os
+import shutil
+import sys
+import tempfile
+import time
+import pygit2
+from doccommit import git
+from doccommit import history
+from doccommit import xml
+
+SIZES = collections.OrderedDict([
+    ("small", {"books": 2, "depth": 3, "fanout": 2, "ids": 5, "commits": 100}),
+    ("medium", {"books": 4, "depth": 4, "fanout": 3, "ids": 10, "commits": 1000}),
+    ("large", {"books": 8, "depth": 5, "fanout": 3, "ids": 20, "commits": 5000}),
+])
+
+BOOK = """<?xml version="1.0" encoding="UTF-8"?>
+<book xmlns="http://docbook.org/ns/docbook" xmlns:xi="http://www.w3.org/2001/XInclude"
+      version="5.0" xml:id="book.{0}">
+ <title>Book {0}</title>
+{1}
+</book>
+"""
+
+SECTION = """<?xml version="1.0" encoding="UTF-8"?>
+<section xmlns="http://docbook.org/ns/docbook" xmlns:xi="http://www.w3.org/2001/XInclude"
+         version="5.0" xml:id="{0}">
+ <title>Section {0}</title>
+{1}
+</section>
+"""
+
+SUBSECTION = """ <section xml:id="{0}">
+  <title>Subsection {0}</title>
+  <para>Text of {0}.</para>
+ </section>"""
+
+REFERENCES = ["bsc#{0}", "BNC#{0}", "https://bugzilla.suse.com/show_bug.cgi?id={0}#c3",
+              "fate#{0}", "https://fate.suse.com/{0}", "doccomments#{0}"]
+
+
+def make_docbook_repo(path, books=2, depth=3, fanout=2, ids=5, commits=100):
+    """
+    Create a synthetic documentation repository. Returns the DocRepo and the list of
+    all XML IDs.
+    """
+    repo = pygit2.init_repository(path)
+    source = os.path.join(path, "xml")
+    images = os.path.join(path, "images", "src", "png")
+    os.makedirs(source)
+    os.makedirs(images)
+    xml_ids = []
+
+    def write_section(book, node, level):
+        section_id = "sec.{0}.{1}".format(book, node)
+        xml_ids.append(section_id)
+        parts = []
+        for number in range(ids):
+            xml_ids.append("{0}.{1}".format(section_id, number))
+            parts.append(SUBSECTION.format(xml_ids[-1]))
+        if level < depth:
+            for child in range(fanout):
+                parts.append(include(book, "{0}_{1}".format(node, child), level + 1))
+        with open(os.path.join(source, "{0}_{1}.xml".format(book, node)), 'w') as xml_file:
+            xml_file.write(SECTION.format(section_id, "\n".join(parts)))
+
+    def include(book, node, level):
+        write_section(book, node, level)
+        return ' <xi:include href="{0}_{1}.xml"/>'.format(book, node)
+
+    for book in range(books):
+        name = "book{0}".format(book)
+        xml_ids.append("book." + name)
+        with open(os.path.join(path, "DC-" + name), 'w') as dc_file:
+            dc_file.write('MAIN="MAIN.{0}.xml"\nROOTID="book.{0}"\n'.format(name))
+        includes = [include(name, str(child), 1) for child in range(fanout)]
+        with open(os.path.join(source, "MAIN.{0}.xml".format(name)), 'w') as main_file:
+            main_file.write(BOOK.format(name, "\n".join(includes)))
+        for number in range(5):
+            with open(os.path.join(images, "{0}-{1}.png".format(name, number)), 'wb') as image:
+                image.write(b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 16)
+
+    repo.index.add_all()
+    repo.index.write()
+    tree = repo.index.write_tree()
+    signature = pygit2.Signature("Doc Writer", "doc@example.com")
+    parents = []
+    for number in range(commits + 1):
+        if number == 0:
+            message = "Initial commit"
+        else:
+            references = ("MINOR", ) if number % 7 == 0 else (
+                REFERENCES[number % len(REFERENCES)].format(1000 + number // 3), )
+            merge_commits = (str(parents[0])[:10], ) if number % 10 == 0 else ()
+            record = git.DocCommit(None, "Change section {0}".format(number),
+                                   "Update @{0} with more details.".format(
+                                       xml_ids[number % len(xml_ids)]),
+                                   git.normalize_many(references),
+                                   (xml_ids[number % len(xml_ids)], ), merge_commits)
+            message = git.format_commit(record)
+        parents = [repo.create_commit("HEAD", signature, signature, message, tree, parents)]
+    return git.DocRepo(path), xml_ids
+
+
+def best_time(function, repeat=3):
+    """
+    Returns the shortest duration of repeat calls of function in seconds
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def iter_benchmarks(docrepo, xml_ids):
+    """
+    Iterate over (name, function) of all benchmarks for a repository
+    """
+    path = docrepo.repo.workdir
+    source = os.path.join(path, "xml") + "/"
+    cache_dir = os.path.join(docrepo.repo.path, "doccommit")
+    messages = [commit.message for commit in history.iter_commits(docrepo.repo)][:500]
+    references = [REFERENCES[number % len(REFERENCES)].format(number)
+                  for number in range(1000)]
+    xml_index = xml.XmlIdIndex(source, cache_dir)
+    commit_message = git.CommitMessage(docrepo, xml_index=xml_index)
+
+    def cold_xml_ids():
+        xml.get_source_xml_ids({}, None, None, source)
+
+    def cached_xml_ids():
+        xml.get_source_xml_ids({}, cache_dir, None, source)
+
+    def parse_commit_message():
+        for message in messages:
+            commit_message.parse_commit_message(message)
+
+    def normalize_reference():
+        commit_message.reference = ",".join(references)
+        commit_message.normalize_reference()
+
+    def validate():
+        args = argparse.Namespace(subject="Change section", message="Add more details.",
+                                  reference="bsc#1, https://fate.suse.com/2",
+                                  xml_ids=",".join(xml_ids[-10:]),
+                                  merge_commits=str(docrepo.repo.head.target)[:10])
+        git.CommitMessage(docrepo, args, xml_index=xml.XmlIdIndex(source, cache_dir)).validate()
+
+    changed = [os.path.join(source, filename) for filename in sorted(os.listdir(source))[:20]]
+    for filename in changed:
+        with open(filename, 'a') as xml_file:
+            xml_file.write("<!-- changed -->\n")
+
+    def stage():
+        docrepo.status(refresh=True)
+        list(docrepo.stage())
+
+    def diff():
+        docrepo.stage_add_all()
+        docrepo.diff(True)
+        docrepo.reset_repo()
+
+    def diff_preview():
+        docrepo.stage_add_all()
+        list(docrepo.diff_preview(True))
+        docrepo.reset_repo()
+
+    def collect_entries():
+        history.collect_entries(docrepo.repo, "HEAD")
+
+    def docupdate():
+        docrepo.known_commits = {}
+        list(history.docupdate(docrepo, "HEAD"))
+
+    cached_xml_ids()
+    yield "xml.get_source_xml_ids (cold)", cold_xml_ids
+    yield "xml.get_source_xml_ids (cached)", cached_xml_ids
+    yield "CommitMessage.parse_commit_message x{0}".format(len(messages)), parse_commit_message
+    yield "CommitMessage.normalize_reference x{0}".format(len(references)), normalize_reference
+    yield "CommitMessage.validate", validate
+    yield "DocRepo.stage", stage
+    yield "DocRepo.diff", diff
+    yield "DocRepo.diff_preview", diff_preview
+    yield "history.collect_entries", collect_entries
+    yield "history.docupdate", docupdate
+
+
+def run(sizes, repeat=3, directory=None, report=print):
+    """
+    Create a repository for every size and time all benchmarks. Returns a list of
+    (size, name, seconds).
+    """
+    results = []
+    for size in sizes:
+        path = tempfile.mkdtemp(prefix="doccommit-benchmark-", dir=directory)
+        try:
+            start = time.perf_counter()
+            docrepo, xml_ids = make_docbook_repo(path, **SIZES[size])
+            report("{0}: {1} XML IDs, {2} commits, created in {3:.2f} s".format(
+                size, len(xml_ids), SIZES[size]["commits"], time.perf_counter() - start))
+            for name, function in iter_benchmarks(docrepo, xml_ids):
+                seconds = best_time(function, repeat)
+                results.append((size, name, seconds))
+                report("  {0:<45} {1:10.4f} s".format(name, seconds))
+        finally:
+            shutil.rmtree(path)
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run the git doccommit benchmarks")
+    parser.add_argument('--sizes', type=str, default="small,medium",
+                        help='Comma separated list of sizes: ' + ", ".join(SIZES))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs, the fastest run is reported')
+    parser.add_argument('--dir', type=str, default=None,
+                        help='Directory for the temporary repositories')
+    args = parser.parse_args(args)
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    for size in sizes:
+        if size not in SIZES:
+            parser.error("Unknown size " + size)
+    run(sizes, args.repeat, args.dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
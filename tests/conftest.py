@@ -0,0 +1,108 @@
+"""
+Fixtures shared by the tests: DocBook sources, commit messages created by git doccommit
+and small repositories
+"""
+import pygit2
+import pytest
+
+BOOK = """<book xmlns="http://docbook.org/ns/docbook" xmlns:xi="http://www.w3.org/2001/XInclude"
+      xml:id="{0}">
+  <title>{1}</title>
+{2}
+</book>
+"""
+
+CHAPTER = """<chapter xmlns="http://docbook.org/ns/docbook" xml:id="{0}">
+  <title>{1}</title>
+  <para xml:id="{0}.para">Text</para>
+</chapter>
+"""
+
+
+@pytest.fixture
+def book():
+    """
+    Returns a function that creates a book including the files hrefs
+    """
+    def make_book(*hrefs, xml_id="book.main", title="Main Book"):
+        includes = ['  <xi:include href="{0}"/>'.format(href) for href in hrefs]
+        return BOOK.format(xml_id, title, "\n".join(includes))
+    return make_book
+
+
+@pytest.fixture
+def chapter():
+    """
+    Returns a function that creates a chapter with a title and one paragraph
+    """
+    return CHAPTER.format
+
+
+@pytest.fixture
+def doc_message():
+    """
+    Returns a function that creates a commit message like git doccommit does
+    """
+    def make_message(subject, message, references, xml_ids, merge_commits=""):
+        lines = [subject, "", message, "", "References: " + references, "XML IDs: " + xml_ids]
+        if merge_commits:
+            lines.append("DocUpdate Merge: " + merge_commits)
+        lines.append("~~ created by git-doccommit version 1.0.5")
+        return "\n".join(lines)
+    return make_message
+
+
+@pytest.fixture
+def signature():
+    return pygit2.Signature("Doc Writer", "doc@example.com")
+
+
+@pytest.fixture
+def commit_all(signature):
+    """
+    Returns a function that commits all files of the working tree
+    """
+    def commit(repo, message):
+        repo.index.add_all()
+        repo.index.write()
+        parents = [] if repo.head_is_unborn else [repo.head.target]
+        return repo.create_commit("HEAD", signature, signature, message,
+                                  repo.index.write_tree(), parents)
+    return commit
+
+
+@pytest.fixture
+def make_repo(book, chapter, commit_all):
+    """
+    Returns a function that creates a repository with a README and xml/MAIN.book.xml,
+    which includes the chapter cha.intro from xml/intro.xml
+    """
+    def make(path):
+        repo = pygit2.init_repository(str(path))
+        repo.config["user.name"] = "Doc Writer"
+        repo.config["user.email"] = "doc@example.com"
+        source = path.mkdir("xml")
+        source.join("MAIN.book.xml").write(book("intro.xml"))
+        source.join("intro.xml").write(chapter("cha.intro", "Introduction"))
+        path.join("README").write("readme")
+        commit_all(repo, "Add book")
+        return repo
+    return make
+
+
+@pytest.fixture
+def make_history(signature):
+    """
+    Returns a function that creates a repository with one empty commit per message.
+    {first} in a message is replaced with the abbreviated ID of the first commit.
+    """
+    def make(path, messages):
+        repo = pygit2.init_repository(str(path))
+        tree = repo.index.write_tree()
+        oids = []
+        for message in messages:
+            message = message.replace("{first}", str(oids[0])[:7] if oids else "")
+            oids.append(repo.create_commit("HEAD", signature, signature, message, tree,
+                                           oids[-1:]))
+        return repo
+    return make
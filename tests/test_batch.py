@@ -0,0 +1,50 @@
+import json
+
+from doccommit import batch
+from doccommit import git
+
+
+def test_batch_run(tmpdir, make_repo):
+    repo = make_repo(tmpdir)
+    tmpdir.chdir()
+
+    tmpdir.join("one.txt").write("one")
+    tmpdir.join("two.txt").write("two")
+    specs = [{"files": ["one.txt"], "subject": "Add first file",
+              "message": "Add the first file to the book.", "references": ["bsc#1234"],
+              "xml_ids": ["cha.intro"]},
+             {"files": "two.txt", "subject": "Add second file",
+              "message": "Add the second file to the book.", "references": "bsc#1234",
+              "xml_ids": "cha.missing"}]
+    tmpdir.join("specs.jsonl").write("\n".join(json.dumps(spec) for spec in specs))
+
+    results = []
+    assert not batch.run(git.DocRepo(str(tmpdir)), "specs.jsonl", report=results.append)
+    first, second = [json.loads(result) for result in results]
+    assert first["ok"] and repo[first["commit"]].tree["one.txt"]
+    assert not second["ok"] and second["problems"] == ["cha.missing does not exist."]
+    assert repo.head.target == repo[first["commit"]].id
+
+
+def test_batch_run_invalid_lines(tmpdir, make_repo):
+    repo = make_repo(tmpdir)
+    # paths are relative to the root of the repository, not to the working directory
+    tmpdir.mkdir("sub").chdir()
+
+    tmpdir.join("one.txt").write("one")
+    spec = {"files": ["one.txt"], "subject": "Add first file",
+            "message": "Add the first file to the book.", "references": ["bsc#1234"],
+            "xml_ids": ["cha.intro"]}
+    tmpdir.join("specs.jsonl").write("\n".join(["not json", "[1, 2]", json.dumps(spec),
+                                                json.dumps({"references": 5})]))
+
+    results = []
+    assert not batch.run(git.DocRepo(str(tmpdir)), str(tmpdir.join("specs.jsonl")),
+                         report=results.append)
+    results = [json.loads(result) for result in results]
+    assert [(result["line"], result["ok"]) for result in results] == \
+        [(1, False), (2, False), (3, True), (4, False)]
+    assert results[0]["problems"][0].startswith("Invalid JSON: ")
+    assert results[1]["problems"] == ["A commit specification must be a JSON object."]
+    assert results[3]["problems"][0].startswith("Invalid commit specification: ")
+    assert repo[results[2]["commit"]].tree["one.txt"]
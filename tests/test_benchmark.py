@@ -0,0 +1,25 @@
+import benchmark
+from doccommit import git
+
+
+def test_make_docbook_repo(tmpdir):
+    docrepo, xml_ids = benchmark.make_docbook_repo(str(tmpdir), books=2, depth=2, fanout=2,
+                                                   ids=3, commits=20)
+    assert len(xml_ids) == len(set(xml_ids)) == 2 * (1 + 6 * 4)
+    assert tmpdir.join("DC-book1").check()
+    assert docrepo.xml_ids("HEAD") == docrepo.xml_ids()
+    assert sorted(docrepo.xml_ids("HEAD")) == sorted(xml_ids)
+    entries = [git.DocCommit.from_message(str(commit.id), commit.message)
+               for commit in docrepo.repo.walk(docrepo.repo.head.target)]
+    assert len([entry for entry in entries if entry is not None]) == 20
+
+
+def test_run_benchmarks(tmpdir):
+    benchmark.SIZES["tiny"] = {"books": 1, "depth": 2, "fanout": 2, "ids": 2, "commits": 10}
+    try:
+        results = benchmark.run(["tiny"], repeat=1, directory=str(tmpdir), report=lambda line: None)
+    finally:
+        del benchmark.SIZES["tiny"]
+    assert len(results) == 10
+    assert all(seconds >= 0 for _, _, seconds in results)
+    assert not tmpdir.listdir()
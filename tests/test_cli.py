@@ -0,0 +1,56 @@
+import subprocess
+import sys
+
+# cumulative import time of doccommit.cli in microseconds
+IMPORT_BUDGET = 150000
+HEAVY_MODULES = ("pygit2", "lxml", "dialog", "sqlite3")
+
+
+def import_times(code):
+    """
+    Run code with -X importtime and return a dict module -> cumulative microseconds
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_import_budget():
+    times = import_times("import doccommit.cli")
+    assert times["doccommit.cli"] < IMPORT_BUDGET
+    assert not [module for module in times if module.split(".")[0] in HEAVY_MODULES]
+
+
+def test_help_does_not_load_heavy_modules():
+    for command in ("doccommit", "docupdate", "docquery"):
+        times = import_times("from doccommit import cli\n" +
+                             "try:\n    cli.{0}(['--help'])\nexcept SystemExit:\n    pass".format(
+                                 command))
+        assert not [module for module in times if module.split(".")[0] in HEAVY_MODULES]
+
+
+def test_git_does_not_load_dialog():
+    times = import_times("import doccommit.git")
+    assert "dialog" not in times
+    assert "lxml" not in times
+
+
+def test_docupdate_default_revision(tmpdir, capsys):
+    import pygit2
+    from doccommit import cli
+    repo = pygit2.init_repository(str(tmpdir))
+    signature = pygit2.Signature("Doc Writer", "doc@example.com")
+    repo.create_commit("HEAD", signature, signature,
+                       "Add section\n\nAdd a section.\n\nReferences: bsc#1\nXML IDs: sec.a\n" +
+                       "~~ created by git-doccommit version 1.0.5",
+                       repo.index.write_tree(), [])
+    tmpdir.chdir()
+    cli.docupdate([])
+    assert "<para>Add a section.</para>" in capsys.readouterr().out
@@ -0,0 +1,63 @@
+import threading
+
+import pygit2
+
+from doccommit import daemon
+from doccommit import git
+
+
+def test_index_server(tmpdir, make_repo):
+    make_repo(tmpdir)
+    docrepo = git.DocRepo(str(tmpdir))
+    path = daemon.socket_path(docrepo)
+    assert daemon.lookup_xml_ids(path, ["cha.intro"]) is None
+
+    server = daemon.IndexServer(docrepo)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05, ))
+    thread.start()
+    try:
+        assert daemon.is_running(path)
+        assert daemon.lookup_xml_ids(path, ["cha.intro", "missing"]) == \
+            {"cha.intro": "Introduction"}
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_refresh_after_fixing_a_file(tmpdir, book, chapter):
+    pygit2.init_repository(str(tmpdir))
+    source = tmpdir.mkdir("xml")
+    source.join("MAIN.book.xml").write(book("ch.xml", "new.xml"))
+    # the chapter is not well-formed
+    source.join("ch.xml").write(chapter("cha.x", "X")[:-len("</chapter>\n")])
+    server = daemon.IndexServer(git.DocRepo(str(tmpdir)))
+    try:
+        assert server.xml_source_ids == {"book.main": "Main Book"}
+        source.join("ch.xml").write(chapter("cha.x", "X"))
+        server.refresh()
+        assert server.xml_source_ids == {"book.main": "Main Book", "cha.x": "X",
+                                         "cha.x.para": None}
+        # included files that did not exist are watched, too
+        source.join("new.xml").write(chapter("cha.new", "New"))
+        server.refresh()
+        assert "cha.new" in server.xml_source_ids
+    finally:
+        server.server_close()
+
+
+def test_validate_message(tmpdir, make_repo):
+    make_repo(tmpdir)
+    server = daemon.IndexServer(git.DocRepo(str(tmpdir)))
+    thread = threading.Thread(target=server.serve_forever, args=(0.05, ))
+    thread.start()
+    try:
+        path = daemon.socket_path(server.docrepo)
+        text = "Add section\n\nAdd a section about {0}.\n\nReferences: bsc#1\nXML IDs: {0}\n"
+        assert daemon.validate_message(path, text.format("cha.intro")) == []
+        assert daemon.validate_message(path, text.format("cha.other")) == \
+            ["cha.other does not exist."]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
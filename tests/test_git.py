@@ -0,0 +1,167 @@
+import argparse
+
+import pygit2
+
+from doccommit import git
+from doccommit import xml
+
+
+def test_xml_ids_from_commit(tmpdir, make_repo, chapter):
+    repo = make_repo(tmpdir)
+    tmpdir.join("xml", "intro.xml").write(chapter("cha.new", "New"))
+    docrepo = git.DocRepo(str(tmpdir))
+    assert docrepo.xml_ids("HEAD") == {"book.main": "Main Book", "cha.intro": "Introduction",
+                                       "cha.intro.para": None}
+
+    repo.index.add("xml/intro.xml")
+    repo.index.write()
+    assert docrepo.xml_ids() == {"book.main": "Main Book", "cha.new": "New",
+                                 "cha.new.para": None}
+    graph = docrepo.xml_graph("HEAD")
+    assert graph.affected_books("xml/intro.xml") == ["xml/MAIN.book.xml"]
+
+
+def test_normalize_many():
+    assert git.normalize_many(["BNC#123", " https://bugzilla.suse.com/show_bug.cgi?id=4#c1",
+                               "fate#5", "https://fate.suse.com/6", "doccomments#7", "",
+                               "MINOR"]) == \
+        ["bsc#123", "bsc#4", "FATE#5", "FATE#6", "dc#7", "MINOR"]
+
+
+def test_parse_message():
+    text = "\n".join(["# Insert subject", "Add section", ""] +
+                     ["Line {0}".format(number) for number in range(200)] +
+                     ["", "References: bsc#1", "XML IDs: sec.a, sec.b", "DocUpdate Merge: abc123",
+                      "References: bsc#2", "~~ created by git-doccommit version 1.0.5"])
+    parsed = git.parse_message(text)
+    assert parsed.subject == "Add section"
+    assert parsed.message.splitlines()[-1] == "Line 199"
+    assert (parsed.references, parsed.xml_ids, parsed.merge_commits) == \
+        ("bsc#1", "sec.a, sec.b", "abc123")
+    assert parsed.doccommit
+    assert not git.parse_message("Subject\n\nText").doccommit
+
+
+def test_validate_and_format_commit():
+    record = git.DocCommit(None, "Add section", "Add a section about the network setup.",
+                           ("bsc#1", "gh#2"), ("sec.a", "sec.b"), ())
+    assert git.validate_commit(record, known_ids={"sec.a"}) == \
+        ["gh#2: Unknown reference type.", "sec.b does not exist."]
+    text = git.format_commit(record)
+    assert git.DocCommit.from_message(None, text) == record
+
+
+def test_commit_message_shares_lazy_index(tmpdir, make_repo):
+    make_repo(tmpdir)
+    tmpdir.chdir()
+    docrepo = git.DocRepo(str(tmpdir))
+    first = git.CommitMessage(docrepo, commit_text="Change a typo\n\nText\n\nReferences: MINOR")
+    second = git.CommitMessage(docrepo, commit_text="Add a section\n\nText")
+    assert first.xml_index is second.xml_index
+    assert first.validate_subject() and first.validate_references()
+    assert first.xml_index.thread is None
+
+    second.xml_ids = "cha.intro, cha.missing"
+    assert not second.validate_xml_ids()
+    assert second.problems == ["cha.missing does not exist."]
+
+
+def test_validate_reports_every_check(tmpdir, make_repo):
+    make_repo(tmpdir)
+    tmpdir.chdir()
+    message = git.CommitMessage(git.DocRepo(str(tmpdir)),
+                                commit_text="Fix\n\nText\n\nReferences: bsc#1\nXML IDs: cha.intro")
+    results = []
+    assert not message.validate(results.append)
+    assert sorted(result.name for result in results) == sorted(git.CHECKS)
+    assert message.problems == ["No keyword found in subject."]
+    assert set(message.timings) == set(git.CHECKS)
+
+
+def test_resolve_commits(tmpdir, make_repo, commit_all):
+    repo = make_repo(tmpdir)
+    oids = [str(repo.head.target)]
+    for number in range(16):
+        tmpdir.join("file.txt").write(str(number))
+        oids.append(str(commit_all(repo, "Commit {0}".format(number))))
+    prefix = next(oid[0] for oid in oids if [other[0] for other in oids].count(oid[0]) > 1)
+    docrepo = git.DocRepo(str(tmpdir))
+    resolution = docrepo.resolve_commits([oids[0][:7], prefix, "0" * 40, oids[1], oids[0][:7]])
+    assert resolution.resolved == {oids[0][:7]: oids[0], oids[1]: oids[1]}
+    assert resolution.ambiguous == [prefix]
+    assert resolution.missing == ["0" * 40]
+    assert docrepo.known_commits[oids[0][:7]] == oids[0]
+    assert docrepo.commit_exists(oids[2][:10]) and not docrepo.commit_exists("xyz")
+
+
+def test_status_limited_to_pathspecs(tmpdir, make_repo, chapter):
+    make_repo(tmpdir)
+    tmpdir.join(".gitignore").write("build/\n")
+    tmpdir.join("xml", "intro.xml").write(chapter("cha.new", "New"))
+    tmpdir.join("xml", "new.xml").write(chapter("cha.other", "Other"))
+    tmpdir.mkdir("images").mkdir("src").join("a.png").write("png")
+    tmpdir.join("xml").mkdir("build").join("tmp.xml").write("")
+    tmpdir.join("README").write("changed")
+
+    docrepo = git.DocRepo(str(tmpdir))
+    assert sorted(docrepo.stage()) == [(".gitignore", False), ("README", False),
+                                       ("images/src/a.png", False), ("xml/intro.xml", False),
+                                       ("xml/new.xml", False)]
+
+    docrepo = git.DocRepo(str(tmpdir), ["xml/", "images/src"])
+    assert sorted(docrepo.stage()) == [("images/src/a.png", False), ("xml/intro.xml", False),
+                                       ("xml/new.xml", False)]
+    # the working tree is only scanned once
+    status = docrepo.status()
+    assert docrepo.status() is status
+    docrepo.stage_add_file("xml/intro.xml")
+    assert list(docrepo.staged_files()) == [("xml/intro.xml", True)]
+    docrepo.reset_repo()
+    assert list(docrepo.staged_files()) == []
+
+
+def test_stage_add_files(tmpdir, make_repo, chapter):
+    make_repo(tmpdir)
+    tmpdir.join(".gitignore").write("*.tmp\n")
+    tmpdir.join("xml", "intro.xml").write(chapter("cha.new", "New"))
+    images = tmpdir.mkdir("images").mkdir("src")
+    images.join("a.png").write("png")
+    images.join("b.png").write("png")
+    images.join("c.tmp").write("tmp")
+    tmpdir.join("README").write("changed")
+
+    docrepo = git.DocRepo(str(tmpdir))
+    docrepo.stage_add_files(["xml/intro.xml", "images"])
+    index = pygit2.Repository(str(tmpdir)).index
+    assert sorted(entry.path for entry in index) == [
+        "README", "images/src/a.png", "images/src/b.png", "xml/MAIN.book.xml", "xml/intro.xml"]
+    assert list(docrepo.staged_files()) == [("xml/intro.xml", True)]
+
+
+def test_diff_preview(tmpdir, make_repo, chapter):
+    make_repo(tmpdir)
+    tmpdir.join("xml", "intro.xml").write(chapter("cha.new", "New") + "\n" * 50)
+    tmpdir.mkdir("images").join("a.png").write_binary(b"\x89PNG\x00\x01")
+    docrepo = git.DocRepo(str(tmpdir))
+    docrepo.stage_add_files(["xml/intro.xml", "images/a.png"])
+
+    preview = list(docrepo.diff_preview())
+    assert preview[:3] == [" A images/a.png", " M xml/intro.xml", " 2 file(s) changed"]
+    assert "--- a/images/a.png" not in preview
+    assert '+<chapter xmlns="http://docbook.org/ns/docbook" xml:id="cha.new">' in preview
+
+    preview = list(docrepo.diff_preview(max_lines=10))
+    assert len(preview) == 3 + 10 + 2
+    assert preview[-1] == "[Diff truncated, 1 file(s) not shown completely]"
+    preview = list(docrepo.diff_preview(max_lines=4))
+    assert preview[3:] == ["", "images/a.png | binary", "", "xml/intro.xml | +53 -3", "",
+                           "[Diff truncated, 1 file(s) not shown completely]"]
+
+
+def test_commit_message_without_jobs(tmpdir, make_repo):
+    make_repo(tmpdir)
+    args = argparse.Namespace(subject="Add section", message="Add a new section.",
+                              reference="bsc#1", xml_ids="cha.intro", merge_commits=None)
+    commit_message = git.CommitMessage(git.DocRepo(str(tmpdir)), args,
+                                       xml_index=xml.XmlIdIndex(str(tmpdir.join("xml"))))
+    assert commit_message.xml_ids == "cha.intro"
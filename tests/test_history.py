@@ -0,0 +1,88 @@
+import json
+
+from doccommit import git
+from doccommit import history
+
+def test_doc_commit_from_message(doc_message):
+    entry = git.DocCommit.from_message("1234", doc_message(
+        "Add section", "Text\n\nMore text", "bsc#1, FATE#2", "sec.a"))
+    assert entry == git.DocCommit("1234", "Add section", "Text\n\nMore text",
+                                  ("bsc#1", "FATE#2"), ("sec.a", ), ())
+    assert git.DocCommit.from_message("1234", "Plain commit\n\nReferences: bsc#1") is None
+
+
+def test_docupdate(tmpdir, make_history, doc_message):
+    make_history(tmpdir, [
+        doc_message("Add section", "Add @sec.a to the guide.", "bsc#1", "sec.a"),
+        doc_message("Change typo", "Fix typo.", "MINOR", "sec.a"),
+        doc_message("Add details", "Add more details.", "FATE#2", "sec.b", "{first}"),
+        doc_message("Add other section", "Add another section.", "bsc#3", "sec.c"),
+        "Commit without trailers"])
+    lines = list(history.docupdate(git.DocRepo(str(tmpdir))))
+    assert lines.count("  <listitem>") == 2
+    text = "\n".join(lines)
+    assert "Fix typo." not in text
+    assert text.index("Add another section.") < text.index('Add <xref linkend="sec.a"/> to')
+    assert text.index('Add <xref linkend="sec.a"/> to') < text.index("Add more details.")
+
+
+def test_collect_entries_checkpoint(tmpdir, monkeypatch, make_history, doc_message, signature):
+    repo = make_history(tmpdir, [doc_message("Add section", "Text.", "bsc#1", "sec.a")])
+    checkpoint = history.Checkpoint(str(tmpdir.join("cache")))
+    assert [entry.subject for entry in history.collect_entries(repo, "HEAD", checkpoint)] == \
+        ["Add section"]
+
+    first = repo.head.target
+    repo.create_commit("HEAD", signature, signature,
+                       doc_message("Add details", "Text.", "bsc#2", "sec.b"),
+                       repo.index.write_tree(), [first])
+    parsed = []
+
+    class CountingDocCommit(git.DocCommit):
+        __slots__ = ()
+
+        @classmethod
+        def from_message(cls, oid, text):
+            parsed.append(oid)
+            return git.DocCommit.from_message(oid, text)
+
+    monkeypatch.setattr(history, "DocCommit", CountingDocCommit)
+    checkpoint = history.Checkpoint(str(tmpdir.join("cache")))
+    assert [entry.subject for entry in history.collect_entries(repo, "HEAD", checkpoint)] == \
+        ["Add details", "Add section"]
+    assert parsed == [str(repo.head.target)]
+
+    rewritten = repo.create_commit(None, signature, signature,
+                                   doc_message("Add other", "Text.", "bsc#4", "sec.d"),
+                                   repo.index.write_tree(), [])
+    repo.head.set_target(rewritten)
+    assert [entry.subject for entry in history.collect_entries(repo, "HEAD", checkpoint)] == \
+        ["Add other"]
+
+
+def test_broken_checkpoint(tmpdir):
+    cache = tmpdir.mkdir("cache")
+    for data in ({"version": 1, "oid": "abc"}, {"version": 1, "oid": "abc", "entries": [["a"]]},
+                 {"version": 1, "oid": "abc", "entries": 5}, [1], "text"):
+        cache.join("docupdate.json").write(json.dumps(data))
+        checkpoint = history.Checkpoint(str(cache))
+        assert (checkpoint.oid, checkpoint.entries) == (None, [])
+
+
+def test_trailer_index(tmpdir, make_history, doc_message, signature):
+    repo = make_history(tmpdir, [
+        doc_message("Add section", "Text.", "bsc#1", "sec.a"),
+        doc_message("Add details", "Text.", "bsc#1, FATE#2", "sec.b")])
+    index = history.TrailerIndex(str(tmpdir.join("cache")))
+    index.update(repo)
+    first, second = [str(commit.id) for commit in history.iter_commits(repo)][::-1]
+    assert index.query("bsc#1") == [second, first]
+    assert index.query("sec.a") == [first]
+
+    third = str(repo.create_commit("HEAD", signature, signature,
+                                   doc_message("Change", "Text.", "bsc#1", "sec.a"),
+                                   repo.index.write_tree(), [repo.head.target]))
+    index.update(repo)
+    assert index.query("sec.a") == [third, first]
+    assert index.query("bsc#3") == []
+    index.close()
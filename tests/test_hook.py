@@ -0,0 +1,119 @@
+import os
+import subprocess
+import sys
+
+import pygit2
+
+from doccommit import git
+from doccommit import hook
+from doccommit import xml
+
+
+def run_hook(docrepo, tmpdir, text):
+    tmpdir.join("COMMIT_EDITMSG").write(text)
+    problems = []
+    valid = hook.commit_msg(docrepo, str(tmpdir.join("COMMIT_EDITMSG")), problems.append)
+    return valid, problems
+
+
+def test_commit_msg_hook(tmpdir, monkeypatch, make_repo, chapter, doc_message):
+    monkeypatch.delenv("GIT_INDEX_FILE", raising=False)
+    make_repo(tmpdir)
+    docrepo = git.DocRepo(str(tmpdir))
+    monkeypatch.setattr(xml.XmlIdIndex, "build", None)
+
+    # XML IDs are not looked up if nothing in xml/ is staged
+    tmpdir.join("README").write("changed")
+    docrepo.stage_add_file("README")
+    assert not docrepo.staged_changes("xml")
+    assert run_hook(docrepo, tmpdir, doc_message(
+        "Add section", "Add a section.", "bsc#1234", "sec.missing")) == (True, [])
+
+    tmpdir.join("xml", "intro.xml").write(chapter("cha.new", "New"))
+    docrepo.stage_add_file("xml/intro.xml")
+    assert docrepo.staged_changes("xml")
+    assert run_hook(docrepo, tmpdir, doc_message(
+        "Add section", "Add the new chapter.", "bsc#1234", "cha.new")) == (True, [])
+    assert run_hook(docrepo, tmpdir, doc_message(
+        "Add section", "Add the old chapter.", "bsc#1234", "cha.intro")) == \
+        (False, ["cha.intro does not exist."])
+
+    valid, problems = run_hook(docrepo, tmpdir, "Fix typo\n\nFixed a typo.\n")
+    assert not valid
+    assert "No XML IDs entered." in problems
+    assert run_hook(docrepo, tmpdir, "fixup! Add section\n") == (True, [])
+
+
+def test_validate_range(tmpdir, make_repo, chapter, commit_all, doc_message):
+    repo = make_repo(tmpdir)
+    docrepo = git.DocRepo(str(tmpdir))
+    base = repo.head.target
+
+    def commit(xml_ids, merge_commits="", intro=None):
+        if intro is not None:
+            tmpdir.join("xml", "intro.xml").write(intro)
+        return commit_all(repo, doc_message("Add section", "Add a section.", "bsc#1234",
+                                            xml_ids, merge_commits))
+
+    first = commit("cha.intro")
+    commit_all(repo, "Merge branch 'other'")
+    # cha.intro does not exist anymore in the tree of this commit
+    second = commit("cha.intro", intro=chapter("cha.new", "New"))
+    third = commit("cha.new", str(first)[:10])
+    fourth = commit("cha.new", "1111111")
+
+    results = hook.validate_range(docrepo, str(base), str(fourth), workers=2)
+    assert results == [hook.RangeResult(str(second), "Add section", ["cha.intro does not exist."]),
+                       hook.RangeResult(str(fourth), "Add section",
+                                        ["1111111 is not a valid commit ID."])]
+    assert tmpdir.join(".git", "doccommit", "blob-ids.json").check()
+    assert hook.validate_range(docrepo, str(second), str(third)) == []
+
+    problems = []
+    assert not hook.check_range(docrepo, str(first) + "..HEAD", report=problems.append)
+    assert problems == [str(second)[:12] + " Add section", "    cha.intro does not exist.",
+                        str(fourth)[:12] + " Add section",
+                        "    1111111 is not a valid commit ID."]
+    assert not hook.check_range(docrepo, "HEAD", report=problems.append)
+
+    # for a new branch, only commits that are not on any other branch are checked
+    repo.head.set_target(second)
+    problems = []
+    null = "0" * 40
+    assert not hook.pre_receive(docrepo, [null + " " + str(fourth) + " refs/heads/topic\n",
+                                          str(second) + " " + null + " refs/heads/old\n"],
+                                report=problems.append)
+    assert problems == [str(fourth)[:12] + " Add section",
+                        "    1111111 is not a valid commit ID."]
+    assert hook.pre_receive(docrepo, [str(second) + " " + str(third) + " refs/heads/master"])
+
+
+def test_pre_receive_hook_on_push(tmpdir, make_repo, doc_message):
+    server = tmpdir.join("server.git")
+    pygit2.init_repository(str(server), bare=True)
+    work = tmpdir.mkdir("work")
+    make_repo(work).remotes.create("origin", str(server))
+    env = dict(os.environ, GIT_AUTHOR_NAME="Doc Writer", GIT_AUTHOR_EMAIL="doc@example.com",
+               GIT_COMMITTER_NAME="Doc Writer", GIT_COMMITTER_EMAIL="doc@example.com")
+
+    def push(message=None):
+        if message is not None:
+            work.join("README").write(message)
+            subprocess.check_call(["git", "commit", "-q", "-a", "-m", message],
+                                  cwd=str(work), env=env)
+        return subprocess.run(["git", "push", "-q", "origin", "HEAD:refs/heads/main"],
+                              cwd=str(work), env=env, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, universal_newlines=True)
+
+    assert push().returncode == 0
+    hook_file = server.join("hooks", "pre-receive")
+    hook_file.write("#!/bin/sh\nexec {0} -m doccommit --hook pre-receive\n".format(
+        sys.executable))
+    hook_file.chmod(0o755)
+
+    # the pushed objects are only in the quarantine directory while the hook runs
+    result = push(doc_message("Add section", "Add a section.", "bsc#1234", "cha.intro"))
+    assert result.returncode == 0, result.stderr
+    result = push(doc_message("Add section", "Add a section.", "bsc#1234", "cha.missing"))
+    assert result.returncode != 0
+    assert "cha.missing does not exist." in result.stderr
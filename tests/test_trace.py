@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import threading
+
+from doccommit import git
+from doccommit import trace
+from doccommit import xml
+
+
+def test_nested_spans(tmpdir):
+    filename = str(tmpdir.join("trace.json"))
+    tracer = trace.enable(filename, "inner")
+    try:
+        with trace.span("outer", size=3):
+            with trace.span("inner"):
+                sum(range(1000))
+            with trace.span("inner"):
+                pass
+    finally:
+        trace.disable()
+    with trace.span("disabled"):
+        pass
+    tracer.save()
+
+    with open(filename) as trace_file:
+        events = json.load(trace_file)["traceEvents"]
+    assert [event["name"] for event in events] == ["outer", "inner", "inner"]
+    outer, inner, _ = events
+    assert outer["args"] == {"size": 3}
+    assert inner["args"] == {"parent": "outer"}
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    # only the first span of the phase is profiled
+    assert sorted(os.listdir(str(tmpdir))) == ["trace.json", "trace.json.inner.prof"]
+
+
+def test_spans_of_threads(tmpdir):
+    tracer = trace.Tracer(str(tmpdir.join("trace.json")))
+
+    def work():
+        with tracer.span("thread", {}):
+            pass
+
+    with tracer.span("main", {}):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+    assert sorted((event["name"], event["args"]) for event in tracer.events) == \
+        [("main", {}), ("thread", {})]
+
+
+def test_spans_of_validation_checks(tmpdir, make_repo):
+    make_repo(tmpdir)
+    args = argparse.Namespace(subject="Add section", message="Add a new section.",
+                              reference="bsc#1", xml_ids="cha.intro", merge_commits=None)
+    commit_message = git.CommitMessage(git.DocRepo(str(tmpdir)), args,
+                                       xml_index=xml.XmlIdIndex(str(tmpdir.join("xml"))))
+    tracer = trace.enable(str(tmpdir.join("trace.json")))
+    try:
+        with trace.span("outer"):
+            commit_message.xml_index.start()
+            assert commit_message.validate()
+            commit_message.xml_index.ids()
+    finally:
+        trace.disable()
+    parents = {event["name"]: event["args"].get("parent") for event in tracer.events}
+    assert parents["validate"] == "outer"
+    assert parents["xml.build"] == "outer"
+    assert parents["xml.get_source_xml_ids"] == "xml.build"
+    for name in git.CHECKS:
+        assert parents["check." + name] == "validate"
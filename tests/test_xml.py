@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+from doccommit import xml
+
+
+def test_get_source_xml_ids(tmpdir, make_repo):
+    make_repo(tmpdir)
+    tmpdir.chdir()
+    xml_source_ids = {}
+    xml.get_source_xml_ids(xml_source_ids)
+    assert xml_source_ids == {"book.main": "Main Book", "cha.intro": "Introduction",
+                              "cha.intro.para": None}
+
+
+def test_get_source_xml_ids_cache(tmpdir, make_repo, chapter):
+    make_repo(tmpdir)
+    tmpdir.chdir()
+    cache_dir = str(tmpdir.join("cache"))
+    xml.get_source_xml_ids({}, cache_dir)
+    assert os.path.isfile(os.path.join(cache_dir, "xml-ids.json"))
+
+    tmpdir.join("xml", "intro.xml").write(chapter("cha.changed", "Changed title"))
+    xml_source_ids = {}
+    xml.get_source_xml_ids(xml_source_ids, cache_dir)
+    assert "cha.intro" not in xml_source_ids
+    assert xml_source_ids["cha.changed"] == "Changed title"
+
+
+def test_include_graph_affected_books(tmpdir, make_repo, book):
+    make_repo(tmpdir)
+    tmpdir.chdir()
+    tmpdir.join("xml", "MAIN.other.xml").write(book("intro.xml", xml_id="book.other"))
+    graph = xml.get_source_xml_ids({})
+    books = [os.path.basename(book) for book in graph.affected_books("xml/intro.xml")]
+    assert books == ["MAIN.book.xml", "MAIN.other.xml"]
+    assert [entry[0] for entry in graph.xml_ids()] == ["book.main", "cha.intro", "cha.intro.para",
+                                                      "book.other"]
+
+
+def test_iter_xml_ids(tmpdir):
+    source = tmpdir.join("chapter.xml")
+    source.write("""<chapter xmlns="http://docbook.org/ns/docbook" xml:id="cha">
+  <para xml:id="no.title">Text</para>
+  <title>Chapter <command>cmd</command></title>
+  <sect1 xml:id="sec"><info><title>Ignored</title></info><title>Section</title></sect1>
+</chapter>""")
+    assert list(xml.iter_xml_ids(str(source))) == [("cha", "Chapter ", str(source)),
+                                                   ("no.title", None, str(source)),
+                                                   ("sec", "Section", str(source))]
+
+
+def test_iter_xml_ids_prolog(tmpdir):
+    source = tmpdir.join("chapter.xml")
+    source.write("""<?xml version="1.0" encoding="UTF-8"?>
+<?xml-stylesheet href="urn:x-daps:xslt:profiling:docbook50-profile.xsl"
+                 type="text/xml" title="Profiling step"?>
+<!-- License text -->
+<chapter xmlns="http://docbook.org/ns/docbook" xml:id="cha.a">
+  <title>A</title>
+</chapter>
+<!-- Trailing comment -->""")
+    assert list(xml.iter_xml_ids(str(source))) == [("cha.a", "A", str(source))]
+    assert xml.parse_file(str(source)) == ([["cha.a", "A"]], [])
+
+
+def test_get_source_xml_ids_workers(tmpdir, make_repo, book):
+    make_repo(tmpdir)
+    tmpdir.chdir()
+    tmpdir.join("xml", "MAIN.other.xml").write(book("intro.xml", xml_id="book.other"))
+    serial = {}
+    xml.get_source_xml_ids(serial)
+    parallel = {}
+    xml.get_source_xml_ids(parallel, workers=2)
+    assert list(parallel.items()) == list(serial.items())
+    # the pool also works in the thread that builds the index in the background
+    index = xml.XmlIdIndex(str(tmpdir.join("xml")) + "/", workers=2)
+    index.build().join()
+    assert index.ids() == serial
+
+
+def test_lookup_cached_ids(tmpdir, make_repo, chapter):
+    make_repo(tmpdir)
+    tmpdir.chdir()
+    path = str(tmpdir.join("xml"))
+    cache_dir = str(tmpdir.join("cache"))
+    assert xml.lookup_cached_ids(path, cache_dir, ["cha.intro"]) is None
+    xml.get_source_xml_ids({}, cache_dir)
+    assert xml.lookup_cached_ids(path, cache_dir, ["cha.intro", "missing"]) == \
+        {"cha.intro": "Introduction"}
+    tmpdir.join("xml", "intro.xml").write(chapter("cha.changed", "Changed title"))
+    assert xml.lookup_cached_ids(path, cache_dir, ["cha.intro"]) is None
+
+
+def test_scan_xml_ids(tmpdir, make_repo, chapter):
+    make_repo(tmpdir)
+    tmpdir.chdir()
+    tmpdir.join("xml", "copy.xml").write(chapter("cha.intro", "Copy"))
+    found = xml.scan_xml_ids(str(tmpdir.join("xml")), ["cha.intro", "cha.intro.para", "cha"])
+    assert [len(found[xml_id]) for xml_id in ["cha.intro", "cha.intro.para", "cha"]] == [2, 2, 0]
+
+
+def test_xml_id_index_failed_build(tmpdir, monkeypatch, make_repo):
+    make_repo(tmpdir)
+    tmpdir.chdir()
+
+    def fail(*args):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(xml, "get_source_xml_ids", fail)
+    index = xml.XmlIdIndex(str(tmpdir.join("xml")))
+    index.build().join()
+    assert not index.complete() and index.failed()
+    # the empty index is not trusted, the text search is used instead
+    assert list(index.find(["cha.intro", "cha.missing"])) == ["cha.intro"]
+    with pytest.raises(RuntimeError):
+        index.ids()